@@ -25,40 +25,62 @@ class AdcSnapshot(Block):
         """
         Send snapshot trigger.
         """
-        self.change_reg_bits('ctrl', 0, self.ADC_SS_TRIG_OFFSET)
-        self.change_reg_bits('ctrl', 1, self.ADC_SS_TRIG_OFFSET)
-        self.change_reg_bits('ctrl', 0, self.ADC_SS_TRIG_OFFSET)
-
-    def _read_samples(self):
+        # Read the control register once, and then toggle the trigger bit
+        # with full-register writes, rather than read-modify-writing each step.
+        ctrl = self.read_uint('ctrl')
+        trig_low = ctrl & ~(1 << self.ADC_SS_TRIG_OFFSET)
+        trig_high = trig_low | (1 << self.ADC_SS_TRIG_OFFSET)
+        if ctrl != trig_low:
+            self.write_int('ctrl', trig_low)
+        self.write_int('ctrl', trig_high)
+        self.write_int('ctrl', trig_low)
+
+    def _read_samples(self, as_complex=True):
         """
         Read samples from the ADC data buffers.
 
-        :return: complex-valued array of ADC samples
+        :param as_complex: If True, return complex values. If False, return
+            the raw I and Q integers.
+        :type as_complex: bool
+
+        :return: complex-valued array of ADC samples, or, if not ``as_complex``,
+            an int16 array with shape [2, n_samples] holding I and Q samples.
         :rtype: numpy.ndarray
         """
-        di = self.read('i', self.NBYTE)
-        dq = self.read('q', self.NBYTE)
+        di, dq = self.read_many([('i', self.NBYTE), ('q', self.NBYTE)])
         i = np.frombuffer(di, dtype=self.dtype)
         q = np.frombuffer(dq, dtype=self.dtype)
+        if not as_complex:
+            out = np.empty([2, i.shape[0]], dtype=np.int16)
+            out[0] = i
+            out[1] = q
+            return out
         return i + 1j*q
 
-    def get_adc_snapshot(self):
+    def get_adc_snapshot(self, as_complex=True):
         """
         Same as `get_snapshot` for backwards compatibility
         """
         self.logger.info('get_adc_snapshot is deprecated. Please use get_snapshot')
-        return self.get_snapshot()
+        return self.get_snapshot(as_complex=as_complex)
 
-    def get_snapshot(self):
+    def get_snapshot(self, as_complex=True):
         """
         Get a data snapshot.
 
-        :return: numpy array of complex valued ADC samples
+        :param as_complex: If True, return complex values. If False, return
+            the raw I and Q integers, which is cheaper if the caller
+            only needs the real and imaginary parts separately.
+        :type as_complex: bool
+
+        :return: numpy array of complex valued ADC samples. If not ``as_complex``,
+            an int16 array with an extra dimension of length 2 before the
+            sample dimension, holding I and Q samples.
         :rtype: numpy.ndarray
         """
 
         self._trigger_snapshot()
-        return self._read_samples()
+        return self._read_samples(as_complex=as_complex)
 
     def plot_adc_snapshot(self, nsamples=None, signals=None):
         """
@@ -79,16 +101,15 @@ class AdcSnapshot(Block):
         :type signals: list of int
         """
         from matplotlib import pyplot as plt
-        x2d = np.atleast_2d(self.get_snapshot())
-        for i in range(x2d.shape[0]):
+        x = self.get_snapshot(as_complex=False)
+        x3d = x.reshape(-1, 2, x.shape[-1])
+        for i in range(x3d.shape[0]):
             if signals is not None:
                 if i not in signals:
                     continue
-            x = x2d[i]
-            if nsamples is not None:
-                x = x[0:nsamples]
-            plt.plot(x.real, label=f'I{i}')
-            plt.plot(x.imag, label=f'Q{i}')
+            xi, xq = x3d[i, :, 0:nsamples]
+            plt.plot(xi, label=f'I{i}')
+            plt.plot(xq, label=f'Q{i}')
         plt.legend()
         plt.ylabel('ADC counts')
         plt.xlabel('Sample Number')
@@ -99,7 +120,7 @@ class AdcSnapshot(Block):
         Same as `plot_spectrum` for backwards compatibility
         """
         self.logger.info('plot_adc_spectrum is deprecated. Please use plot_spectrum')
-        return plot_spectrum(db=db)
+        return self.plot_spectrum(db=db, signals=signals)
 
     def plot_spectrum(self, db=False, signals=None):
         """
@@ -113,12 +134,18 @@ class AdcSnapshot(Block):
         :type signals: list of int
         """
         from matplotlib import pyplot as plt
-        x2d = np.atleast_2d(self.get_snapshot())
-        for i in range(x2d.shape[0]):
+        x = self.get_snapshot(as_complex=False)
+        x3d = x.reshape(-1, 2, x.shape[-1])
+        # 16-bit samples are represented exactly in single precision
+        xc = np.empty(x3d.shape[-1], dtype=np.complex64)
+        for i in range(x3d.shape[0]):
             if signals is not None:
                 if i not in signals:
                     continue
-            X = np.abs(np.fft.fft(x2d[i]))**2
+            xc.real = x3d[i, 0]
+            xc.imag = x3d[i, 1]
+            X = np.fft.fft(xc)
+            X = X.real**2 + X.imag**2
             if db:
                 X = 10*np.log10(X)
             plt.plot(np.fft.fftshift(X), label=f'{i}')
@@ -1,8 +1,56 @@
 import logging
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from termcolor import colored
 from souk_mkid_readout import helpers
 from souk_mkid_readout import error_levels as el
 
+#: Maximum number of threads used to issue concurrent register accesses to any one host
+MAX_CONCURRENT_ACCESSES = 8
+#: Names of CasperFpga transport classes which can safely handle requests
+#: from several threads at once. Accesses through any other transport are
+#: issued sequentially.
+THREAD_SAFE_TRANSPORTS = ['KatcpTransport']
+
+# One thread pool per host, shared by all of its blocks
+_executors = weakref.WeakKeyDictionary()
+_executors_lock = threading.Lock()
+
+def _get_executor(host):
+    """
+    Get the thread pool used to issue concurrent register accesses to a host,
+    creating it if necessary.
+
+    :param host: CasperFpga interface for host.
+    :type host: casperfpga.CasperFpga
+
+    :return: Thread pool with at most `MAX_CONCURRENT_ACCESSES` workers
+    :rtype: concurrent.futures.ThreadPoolExecutor
+    """
+    with _executors_lock:
+        ex = _executors.get(host)
+        if ex is None:
+            ex = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_ACCESSES)
+            _executors[host] = ex
+        return ex
+
+def _is_thread_safe(host):
+    """
+    Determine whether a host's transport is known to handle concurrent
+    register accesses, i.e. whether it appears in `THREAD_SAFE_TRANSPORTS`.
+    Each access through such a transport (e.g. katcp) is a network round trip,
+    so overlapping even a couple of them saves time.
+
+    :param host: CasperFpga interface for host.
+    :type host: casperfpga.CasperFpga
+
+    :return: True if `host` may be accessed from several threads at once
+    :rtype: bool
+    """
+    transport = getattr(host, 'transport', None)
+    return type(transport).__name__ in THREAD_SAFE_TRANSPORTS
+
 class Block(object):
     """
     A class to encapsulate a Simulink subsystem, which
@@ -112,6 +160,14 @@ class Block(object):
         :type read_only: bool
         """
 
+    def invalidate_cache(self):
+        """
+        Forget any record of values previously written to hardware.
+        Blocks which skip redundant writes should override this
+        method to clear their caches. It should be called whenever the
+        board may have been reprogrammed or reconfigured by another client.
+        """
+        pass
 
     def listdev(self):
         """
@@ -142,16 +198,22 @@ class Block(object):
         register name to reflect the name of this block in the system
         hierarchy. Also add exception handling to skip writes which fail
         because a register doesn't exist.
+
+        :return: True if the write was made, False if it was skipped because
+            the register doesn't exist.
+        :rtype: bool
         """
         try:
             self.host.write_int(self.prefix + reg, val, word_offset=word_offset, **kwargs)
         except:
             if reg not in self.listdev():
                 self.logger.error("Tried to read register %s which doesn't exist!" % reg)
+                return False
             else:
                 # Only raise an exception if the register is there, otherwise
                 # just skip the write
                 raise
+        return True
 
     def read_uint(self, reg, word_offset=0, **kwargs):
         """
@@ -168,7 +230,7 @@ class Block(object):
                 self.logger.error("Tried to read register %s which doesn't exist!" % reg)
             raise
 
-    def read(self, reg, nbytes, **kwargs):
+    def read(self, reg, nbytes, offset=0, **kwargs):
         """
         A simple wrapper around CasperFpga.read(), which modifies the
         register name to reflect the name of this block in the system
@@ -177,7 +239,7 @@ class Block(object):
         a register doesn't exist.
         """
         try:
-            return self.host.read(self.prefix + reg, nbytes, **kwargs)
+            return self.host.read(self.prefix + reg, nbytes, offset=offset, **kwargs)
         except:
             if reg not in self.listdev():
                 self.logger.error("Tried to read register %s which doesn't exist!" % reg)
@@ -189,16 +251,117 @@ class Block(object):
         register name to reflect the name of this block in the system
         hierarchy. Also add exception handling to skip writes which fail
         because a register doesn't exist.
+
+        :return: True if the write was made, False if it was skipped because
+            the register doesn't exist.
+        :rtype: bool
         """
         try:
             self.host.write(self.prefix + reg, val, offset=offset, **kwargs)
         except:
             if reg not in self.listdev():
                 self.logger.error("Tried to read register %s which doesn't exist!" % reg)
+                return False
             else:
                 # Only raise an exception if the register is there, otherwise
                 # just skip the write
                 raise
+        return True
+
+    def _call_concurrent(self, func, args, n_threads=None):
+        """
+        Call `func` once for each tuple of arguments in `args`, using
+        this host's shared thread pool so that the calls run concurrently.
+
+        Calls are only made concurrently if the host's transport is listed in
+        `THREAD_SAFE_TRANSPORTS`. For any other transport (e.g. local memory
+        or TAPCP) they are issued sequentially in the calling thread.
+        Pass `n_threads=1` to force sequential calls regardless.
+
+        :param func: Function to call
+        :type func: callable
+
+        :param args: List of argument tuples with which to call `func`
+        :type args: list
+
+        :param n_threads: If 1, call sequentially. Otherwise, calls may be
+            issued concurrently, with at most `MAX_CONCURRENT_ACCESSES`
+            in flight.
+        :type n_threads: int
+
+        :return: List of the values returned by each call, in the order of `args`
+        :rtype: list
+        """
+        if (n_threads is not None and n_threads <= 1) or len(args) < 2 \
+                or not _is_thread_safe(self.host):
+            return [func(*a) for a in args]
+        ex = _get_executor(self.host)
+        futures = [ex.submit(func, *a) for a in args]
+        # Propagate any exceptions
+        return [f.result() for f in futures]
+
+    def read_many(self, reads, n_threads=None):
+        """
+        Read data from multiple registers, issuing the reads concurrently.
+        This is the `read` equivalent of `write_many`.
+
+        :param reads: List of (reg, nbytes) or (reg, nbytes, offset) tuples, where
+            `reg` is the name of a register (relative to this block), `nbytes` the
+            number of bytes to read from it, and `offset` an optional offset in bytes.
+        :type reads: list
+
+        :param n_threads: If 1, read sequentially. Otherwise, reads may be
+            issued concurrently (see `_call_concurrent`).
+        :type n_threads: int
+
+        :return: List of the bytes read from each register, in the order of `reads`
+        :rtype: list
+        """
+        return self._call_concurrent(self.read, reads, n_threads=n_threads)
+
+    def write_many(self, writes, n_threads=None):
+        """
+        Write data to multiple registers, issuing the writes concurrently.
+        Since each write is dominated by the latency of the underlying
+        CasperFpga transport, this can be substantially faster than
+        making the same writes one after another. Each register is a separate
+        memory, so the writes are independent and may complete in any order.
+
+        :param writes: List of (reg, val) tuples, where `reg` is the name of
+            a register (relative to this block) and `val` the bytes to be
+            written to it. Each register should appear only once.
+        :type writes: list
+
+        :param n_threads: If 1, write sequentially. Otherwise, writes may be
+            issued concurrently (see `_call_concurrent`).
+        :type n_threads: int
+
+        :return: List of the values returned by `write` for each write, in the
+            order of `writes`. False entries mark writes which were skipped.
+        :rtype: list
+        """
+        return self._call_concurrent(self.write, writes, n_threads=n_threads)
+
+    def write_int_many(self, writes, n_threads=None):
+        """
+        Write integers to multiple registers, issuing the writes concurrently.
+        This is the `write_int` equivalent of `write_many`.
+
+        :param writes: List of (reg, val) or (reg, val, word_offset) tuples, where
+            `reg` is the name of a register (relative to this block), `val` the
+            integer to be written to it, and `word_offset` an optional offset in
+            32-bit words. Each register word should appear only once.
+        :type writes: list
+
+        :param n_threads: If 1, write sequentially. Otherwise, writes may be
+            issued concurrently (see `_call_concurrent`).
+        :type n_threads: int
+
+        :return: List of the values returned by `write_int` for each write, in the
+            order of `writes`. False entries mark writes which were skipped.
+        :rtype: list
+        """
+        return self._call_concurrent(self.write_int, writes, n_threads=n_threads)
 
     def blindwrite(self, reg, val, **kwargs):
         """
@@ -206,16 +369,22 @@ class Block(object):
         register name to reflect the name of this block in the system
         hierarchy. Also add exception handling to skip writes which fail
         because a register doesn't exist.
+
+        :return: True if the write was made, False if it was skipped because
+            the register doesn't exist.
+        :rtype: bool
         """
         try:
             self.host.blindwrite(self.prefix + reg, val, **kwargs)
         except:
             if reg not in self.listdev():
                 self.logger.error("Tried to read register %s which doesn't exist!" % reg)
+                return False
             else:
                 # Only raise an exception if the register is there, otherwise
                 # just skip the write
                 raise
+        return True
 
     def change_reg_bits(self, reg, val, start, width=1, word_offset=0, blindwrite=False):
         """
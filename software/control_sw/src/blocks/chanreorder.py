@@ -1,7 +1,58 @@
 import struct
 import numpy as np
 from .block import Block
-from ..helpers import get_casper_fft_descramble, get_casper_fft_scramble
+from ..helpers import get_casper_fft_descramble, get_casper_fft_scramble, njit
+
+@njit(cache=True, boundscheck=False)
+def _decode_outmap(serial_maps, parallel_maps, n_parallel_chans_in,
+                   n_parallel_chans_out, parallel_first, out):
+    """
+    Convert serial and parallel reorder maps, as read from firmware, into
+    an output channel map.
+
+    :param serial_maps: Native-endian serial maps, with shape
+        [n_parallel_chans_in, n_serial_chans_in]
+    :type serial_maps: numpy.ndarray
+
+    :param parallel_maps: Native-endian parallel maps, with shape
+        [n_serial_chans_in, n_parallel_chans_out]
+    :type parallel_maps: numpy.ndarray
+
+    :param n_parallel_chans_in: Number of parallel input channels
+    :type n_parallel_chans_in: int
+
+    :param n_parallel_chans_out: Number of parallel output channels
+    :type n_parallel_chans_out: int
+
+    :param parallel_first: If True, decode maps for a firmware block which
+        reorders in the parallel dimension before the serial dimension.
+    :type parallel_first: bool
+
+    :param out: Array into which the output map is written. Entry `i` is
+        the channel number which emerges in the `i`th output position, or -1
+        if this output is disabled.
+    :type out: numpy.ndarray
+    """
+    for outn in range(out.shape[0]):
+        # Which output parallel stream is output outn in
+        out_pstream = outn % n_parallel_chans_out
+        # Which output serial position is output outn in
+        out_spos = outn // n_parallel_chans_out
+        if parallel_first:
+            in_spos = serial_maps[out_pstream, out_spos] # serial input position
+            if in_spos == -1: # indicates not enabled
+                out[outn] = -1
+            else:
+                in_pstream = parallel_maps[in_spos, out_pstream]
+                out[outn] = in_spos * n_parallel_chans_in + in_pstream
+        else:
+            in_pstream = parallel_maps[out_spos, out_pstream]
+            # Catch special case where input is disabled
+            if in_pstream == n_parallel_chans_in + 1:
+                out[outn] = -1 # -1 indicates disabled
+            else:
+                in_stream = serial_maps[in_pstream, out_spos]
+                out[outn] = in_stream * n_parallel_chans_in + in_pstream
 
 class ChanReorder(Block):
     """
@@ -103,10 +154,12 @@ class ChanReorder(Block):
         """
         outmap = self._validate_outmap(outmap)
 
+        # Build maps with native byte order, and only convert to the
+        # firmware's big-endian format when writing
         serial_maps = np.zeros([self._n_parallel_chans_in, self._n_serial_chans_in],
-                          dtype='>%s' % self._map_format)
+                          dtype=np.int32)
         parallel_maps = np.zeros([self._n_serial_chans_in, self._n_parallel_chans_out],
-                          dtype='>i1')
+                          dtype=np.uint8)
         # Keep track of which entries have been written
         # so we can warn if something is overwritten
         serial_maps_written = [[False for _ in range(self._n_serial_chans_in)]
@@ -180,9 +233,12 @@ class ChanReorder(Block):
                         self.logger.info(f'Previously: {last_msg}')
                     parallel_maps[p_map_loc, out_pstream] = self._n_parallel_chans_in + 1
                     parallel_maps_written[p_map_loc][out_pstream] = debug_msg
-        for i in range(self._n_parallel_chans_in):
-            self.write(f'reorder_{i}_{self._map_reg}', serial_maps[i].tobytes())
-        self.write('pmap', parallel_maps.flatten().tobytes())
+        serial_maps = serial_maps.astype('>%s' % self._map_format)
+        writes = [(f'reorder_{i}_{self._map_reg}', serial_maps[i].tobytes())
+                  for i in range(self._n_parallel_chans_in)]
+        # parallel_maps is C-contiguous, so its bytes are already in flattened order
+        writes += [('pmap', parallel_maps.tobytes())]
+        self.write_many(writes)
             
 
     def get_channel_outmap(self):
@@ -194,42 +250,25 @@ class ChanReorder(Block):
         :rtype: list
         """
 
+        # Maps are converted to native byte order as they are read
         serial_maps = np.zeros([self._n_parallel_chans_in, self._n_serial_chans_in],
-                          dtype='>%s' % self._map_format)
+                          dtype=np.int32)
         parallel_maps = np.zeros([self._n_serial_chans_in, self._n_parallel_chans_out],
-                          dtype='>B')
+                          dtype=np.uint8)
 
-        nbytes_s = len(serial_maps[0].tobytes())
+        nbytes_s = self._n_serial_chans_in * np.dtype(self._map_format).itemsize
         for i in range(self._n_parallel_chans_in):
             raw = self.read(f'reorder_{i}_{self._map_reg}', nbytes_s)
-            serial_maps[i] = np.frombuffer(raw, dtype=serial_maps.dtype)
-        nbytes_p = len(parallel_maps.tobytes())
+            serial_maps[i] = np.frombuffer(raw, dtype='>%s' % self._map_format)
+        nbytes_p = parallel_maps.size * parallel_maps.dtype.itemsize
         raw = self.read('pmap', nbytes_p)
-        parallel_map1d = np.frombuffer(raw, dtype=parallel_maps.dtype)
+        parallel_map1d = np.frombuffer(raw, dtype='>B')
         parallel_maps[:,:] = parallel_map1d.reshape(parallel_maps.shape)
 
-        outmap = np.zeros(self.n_chans_out, dtype=int)
-        for outn in range(self.n_chans_out):
-            # Which output parallel stream is output outn in
-            out_pstream = outn % self._n_parallel_chans_out
-            # Which output serial position is output outn in
-            out_spos = outn // self._n_parallel_chans_out
-            if self._parallel_first:
-                in_spos = serial_maps[out_pstream, out_spos] # serial input position
-                if in_spos == -1: # indicates not enabled
-                    in_chan = -1
-                else:
-                    in_pstream = parallel_maps[in_spos, out_pstream]
-                    in_chan = in_spos * self._n_parallel_chans_in + in_pstream
-            else:
-                in_pstream = parallel_maps[out_spos, out_pstream]
-                # Catch special case where input is disabled
-                if in_pstream == self._n_parallel_chans_in + 1:
-                    in_chan = -1 # -1 indicates disabled
-                else:
-                    in_stream = serial_maps[in_pstream, out_spos]
-                    in_chan = in_stream * self._n_parallel_chans_in + in_pstream
-            outmap[outn] = in_chan
+        outmap = np.zeros(self.n_chans_out, dtype=np.int64)
+        _decode_outmap(serial_maps, parallel_maps,
+                       self._n_parallel_chans_in, self._n_parallel_chans_out,
+                       self._parallel_first, outmap)
         return outmap
 
     def set_single_channel(self, outidx, inidx):
@@ -366,8 +405,10 @@ class ChanReorderMultiSample(ChanReorder):
         parallel_map[0:nout] = block_p_offset
         parallel_map[0:nout][outmap == -1] = self._reduction_factor + 1
 
-        self.write(f'map0_{self._map_reg}', np.array(serial_map, dtype=self._map_format).tobytes())
-        self.write('pmap', np.array(parallel_map, dtype=self._pmap_format).tobytes())
+        self.write_many([
+            (f'map0_{self._map_reg}', np.array(serial_map, dtype=self._map_format).tobytes()),
+            ('pmap', np.array(parallel_map, dtype=self._pmap_format).tobytes()),
+        ])
 
     def get_channel_outmap(self, descramble_input=None):
         """
@@ -529,8 +570,8 @@ class ChanReorderMultiSampleIn(ChanReorder):
 
         serial_maps = np.array(serial_maps, dtype=self._map_format)
 
-        for i in range(self._expansion_factor):
-            self.write(f'map{i}_{self._map_reg}', serial_maps[i].tobytes())
+        self.write_many([(f'map{i}_{self._map_reg}', serial_maps[i].tobytes())
+                         for i in range(self._expansion_factor)])
 
     def get_channel_outmap(self):
         """
@@ -646,10 +687,12 @@ class ChanReorderPS(ChanReorder):
         """
         outmap = self._validate_outmap(outmap)
 
+        # Build maps with native byte order, and only convert to the
+        # firmware's big-endian format when writing
         serial_maps = np.zeros([self._n_parallel_chans_in, self._n_serial_chans_in],
-                          dtype='>%s' % self._map_format)
+                          dtype=np.int32)
         parallel_maps = np.zeros([self._n_serial_chans_in, self._n_parallel_chans_in],
-                          dtype='>i1')
+                          dtype=np.uint8)
         # Keep track of which entries have been written
         # so we can warn if something is overwritten
         serial_maps_written = [[False for _ in range(self._n_serial_chans_in)]
@@ -698,9 +741,12 @@ class ChanReorderPS(ChanReorder):
                     self.logger.info(f'Previously: {last_msg}')
                 parallel_maps[out_spos, out_pstream] = self._n_parallel_chans_in + 1
                 parallel_maps_written[out_spos][out_pstream] = debug_msg
-        for i in range(self._n_parallel_chans_in):
-            self.write(f'reorder_{i}_{self._map_reg}', serial_maps[i].tobytes())
-        self.write('pmap', parallel_maps.reshape(self.n_chans_out).tobytes())
+        serial_maps = serial_maps.astype('>%s' % self._map_format)
+        writes = [(f'reorder_{i}_{self._map_reg}', serial_maps[i].tobytes())
+                  for i in range(self._n_parallel_chans_in)]
+        # parallel_maps is C-contiguous, so its bytes are already in flattened order
+        writes += [('pmap', parallel_maps.tobytes())]
+        self.write_many(writes)
             
 
     def get_channel_outmap(self):
@@ -712,35 +758,23 @@ class ChanReorderPS(ChanReorder):
         :rtype: list
         """
 
+        # Maps are converted to native byte order as they are read
         serial_maps = np.zeros([self._n_parallel_chans_in, self._n_serial_chans_in],
-                          dtype='>%s' % self._map_format)
+                          dtype=np.int32)
         parallel_maps = np.zeros([self._n_serial_chans_in, self._n_parallel_chans_out],
-                          dtype='>B')
+                          dtype=np.uint8)
 
-        nbytes_s = len(serial_maps[0].tobytes())
+        nbytes_s = self._n_serial_chans_in * np.dtype(self._map_format).itemsize
         for i in range(self._n_parallel_chans_in):
             raw = self.read(f'reorder_{i}_{self._map_reg}', nbytes_s)
-            serial_maps[i] = np.frombuffer(raw, dtype=serial_maps.dtype)
-        nbytes_p = len(parallel_maps.tobytes())
+            serial_maps[i] = np.frombuffer(raw, dtype='>%s' % self._map_format)
+        nbytes_p = parallel_maps.size * parallel_maps.dtype.itemsize
         raw = self.read('pmap', nbytes_p)
-        parallel_map1d = np.frombuffer(raw, dtype=parallel_maps.dtype)
+        parallel_map1d = np.frombuffer(raw, dtype='>B')
         parallel_maps[:,:] = parallel_map1d.reshape(parallel_maps.shape)
 
-        outmap = np.zeros(self.n_chans_out, dtype=int)
-        for outn in range(self.n_chans_out):
-            # Which output parallel stream is output outn in
-            out_pstream = outn % self._n_parallel_chans_out
-            # Which output serial position is output outn in
-            out_spos = outn // self._n_parallel_chans_out
-            # Which input parallel stream was feeding out_pstream?
-            in_pstream = parallel_maps[out_spos, out_pstream]
-            # Catch special case where input is disabled
-            if in_pstream == self._n_parallel_chans_in + 1:
-                in_chan = -1 # -1 indicates disabled
-            else:
-                # Which input serial position was feeding out_spos
-                in_stream = serial_maps[in_pstream, out_spos]
-                # convert to an input channel number
-                in_chan = in_stream * self._n_parallel_chans_in + in_pstream
-            outmap[outn] = in_chan
+        outmap = np.zeros(self.n_chans_out, dtype=np.int64)
+        _decode_outmap(serial_maps, parallel_maps,
+                       self._n_parallel_chans_in, self._n_parallel_chans_out,
+                       False, outmap)
         return outmap
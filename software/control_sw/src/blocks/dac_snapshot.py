@@ -4,17 +4,29 @@ from .adc_snapshot import AdcSnapshot
 
 class DacSnapshot(AdcSnapshot):
     NBYTE = 32 * 2**9 # Number of bytes in each of the buffers
-    def _read_samples(self):
+    def _read_samples(self, as_complex=True):
         """
         Read samples from the DAC data buffers.
 
-        :return: 2D complex-valued array of DAC samples
+        :param as_complex: If True, return complex values. If False, return
+            the raw I and Q integers.
+        :type as_complex: bool
+
+        :return: 2D complex-valued array of DAC samples, or, if not ``as_complex``,
+            an int16 array with shape [2, 2, n_samples] holding each
+            signal's I and Q samples.
         :rtype: numpy.ndarray
         """
-        d0_raw = self.read('0', self.NBYTE)
-        d1_raw = self.read('1', self.NBYTE)
+        d0_raw, d1_raw = self.read_many([('0', self.NBYTE), ('1', self.NBYTE)])
         d0iq = np.frombuffer(d0_raw, dtype=self.dtype)
         d1iq = np.frombuffer(d1_raw, dtype=self.dtype)
+        if not as_complex:
+            out = np.empty([2, 2, d0iq.shape[0] // 2], dtype=np.int16)
+            out[0, 0] = d0iq[0::2]
+            out[0, 1] = d0iq[1::2]
+            out[1, 0] = d1iq[0::2]
+            out[1, 1] = d1iq[1::2]
+            return out
         d0 = d0iq[0::2] + 1j*d0iq[1::2]
         d1 = d1iq[0::2] + 1j*d1iq[1::2]
         return np.vstack([d0, d1])
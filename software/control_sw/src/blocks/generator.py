@@ -1,8 +1,43 @@
+import struct
 import numpy as np
 
 from .block import Block
 from souk_mkid_readout.error_levels import *
 
+from ..helpers import njit, prange, HAS_NUMBA
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _fill_multi_tone(freqs_hz, amplitudes, phases, sample_rate_hz, out):
+    """
+    Compute the sum of a set of complex tones.
+
+    :param freqs_hz: Tone frequencies, in Hz
+    :type freqs_hz: numpy.ndarray
+
+    :param amplitudes: Tone amplitudes
+    :type amplitudes: numpy.ndarray
+
+    :param phases: Tone starting phases, in radians
+    :type phases: numpy.ndarray
+
+    :param sample_rate_hz: DAC sample rate, in Hz
+    :type sample_rate_hz: float
+
+    :param out: Complex array into which the summed waveform is written.
+        One tone sample is computed for each element.
+    :type out: numpy.ndarray
+    """
+    n_tones = freqs_hz.shape[0]
+    for i in prange(out.shape[0]):
+        t = i / sample_rate_hz
+        re = 0.0
+        im = 0.0
+        for j in range(n_tones):
+            phase = 2*np.pi*freqs_hz[j]*t + phases[j]
+            re += amplitudes[j] * np.cos(phase)
+            im += amplitudes[j] * np.sin(phase)
+        out[i] = re + 1j*im
+
 class Generator(Block):
     _n_bp = 15 #: vector binary point
     def __init__(self, host, name, logger=None):
@@ -21,7 +56,28 @@ class Generator(Block):
         self.n_generators  = None
         self._n_parallel   = None
         self.n_samples     = None
+        # Fixed-point scaling constants
+        self._scale = 1 << self._n_bp # LUT / amplitude scale factor
+        self._scale_max = self._scale - 1 # Largest LUT value used (disallows max negative value)
+        self._phase_scale = 1 << 63 # CORDIC phase increment scale factor
+        self._default_amp = 0.95 * (1 - 1.0 / self._scale) # 95% max scale
+        # Cached sample times, phase buffer and window for LUT waveform generation
+        self._t = None
+        self._t_sample_rate_hz = None
+        self._phase_buf = None
+        self._hann = None
+        # set_output_freq parameters used to generate each LUT's current contents
+        self._lut_params = {}
         self._get_block_params()
+
+    def invalidate_cache(self):
+        """
+        Forget the waveforms remembered by ``set_output_freq``, so that
+        subsequent calls load the LUTs unconditionally. Call this
+        if the generator has been modified other than through this
+        object (e.g. by reprogramming the FPGA, or from another process).
+        """
+        self._lut_params = {}
     
     def _get_block_params(self):
         """
@@ -35,6 +91,77 @@ class Generator(Block):
         self._n_parallel  = (x >> 16) & 0xff
         self.n_samples    = 2**((x >> 8)  & 0xff)
 
+    def _format_lut_output(self, x, scale=True):
+        """
+        Convert an array of complex samples into the big-endian
+        integer representation stored in a generator LUT.
+
+        :param x: Array (or list) of complex sample values
+        :type x: list or numpy.array
+
+        :param scale: If True, scale to the maximum possible amplitude range in event of overflow.
+            Otherwise, saturate overflowing values.
+        :type scale: bool
+
+        :return: (real_bytes, imag_bytes) tuple of data to be written to the
+            LUT's I and Q memories, or None if `x` has the wrong length.
+        :rtype: (bytes, bytes)
+        """
+        x = np.asarray(x)
+        if len(x) != self.n_samples:
+            self.logger.error(f'{len(x)} sample were provided but expected {self.n_samples}')
+            return None
+        # Scale into a new array, so the caller's samples are never modified
+        x = np.multiply(x, self._scale, dtype=complex)
+        max_val = np.max([np.max(np.abs(x.real)), np.max(np.abs(x.imag))])
+        if max_val > self._scale_max:
+            f = self._scale_max / max_val
+            if scale:
+                self.logger.warning(f'Rescaling values by {f}')
+                x *= f
+            else:
+                self.logger.warning('Saturating some vector values')
+                x.real[x.real > self._scale_max] = self._scale_max
+                x.real[x.real < -self._scale_max] = -self._scale_max
+                x.imag[x.imag > self._scale_max] = self._scale_max
+                x.imag[x.imag < -self._scale_max] = -self._scale_max
+
+        # Round directly into one big-endian buffer holding both I and Q
+        iq = np.empty([2, self.n_samples], dtype='>i2')
+        np.rint(x.real, out=iq[0], casting='unsafe')
+        np.rint(x.imag, out=iq[1], casting='unsafe')
+        # Each row is contiguous, so tobytes() is a single copy. casperfpga
+        # transports expect bytes, so the rows can't be passed as memoryviews.
+        return iq[0].tobytes(), iq[1].tobytes()
+
+    def _write_lut_output(self, n, real_bytes, imag_bytes, params=None):
+        """
+        Load pre-formatted data into LUT output `n`.
+
+        :param n: Which generator to target.
+        :type n: int
+
+        :param real_bytes: Data for the LUT's I memory, as returned by `_format_lut_output`
+        :type real_bytes: bytes
+
+        :param imag_bytes: Data for the LUT's Q memory, as returned by `_format_lut_output`
+        :type imag_bytes: bytes
+
+        :param params: The `set_output_freq` parameters which generated this data,
+            if any. Used to skip reloading identical waveforms.
+        :type params: tuple
+        """
+        if n >= self.n_generators:
+            self.logger.error(f'Requested generator {n}, but only {self.n_generators} are provided')
+            return
+        ok_i = self.write(f'{n}_i', real_bytes)
+        ok_q = self.write(f'{n}_q', imag_bytes)
+        # Only remember waveforms which were loaded in full
+        if ok_i and ok_q:
+            self._lut_params[n] = params
+        else:
+            self._lut_params.pop(n, None)
+
     def set_lut_output(self, n, x, scale=True):
         """
         Set LUT output `n` to sample array `x`.
@@ -55,44 +182,40 @@ class Generator(Block):
         if n >= self.n_generators:
             self.logger.error(f'Requested generator {n}, but only {self.n_generators} are provided')
             return
-        x = np.array(x)
-        if len(x) != self.n_samples:
-            self.logger.error(f'{len(x)} sample were provided but expected {self.n_samples}')
+        lut = self._format_lut_output(x, scale=scale)
+        if lut is None:
             return
-        x *= 2**self._n_bp
-        max_val = np.max([np.max(np.abs(x.real)), np.max(np.abs(x.imag))])
-        if max_val > (2**self._n_bp - 1): # Disallows max negative value
-            f = (2**self._n_bp - 1) / max_val
-            if scale:
-                self.logger.warning(f'Rescaling values by {f}')
-                x *= f
-            else:
-                self.logger.warning('Saturating some vector values')
-                x.real[x.real > (2**self._n_bp - 1)] = 2**self._n_bp
-                x.real[x.real < -(2**self._n_bp - 1)] = -2**self._n_bp
-                x.imag[x.imag > (2**self._n_bp - 1)] = 2**self._n_bp
-                x.imag[x.imag < -(2**self._n_bp - 1)] = -2**self._n_bp
+        self._write_lut_output(n, *lut)
 
-        imag = np.array(np.round(x.imag), dtype='>i2')
-        real = np.array(np.round(x.real), dtype='>i2')
-        self.write(f'{n}_i', real.tobytes())
-        self.write(f'{n}_q', imag.tobytes())
-
-    def get_lut_output(self, n):
+    def get_lut_output(self, n, as_complex=True):
         """
         Get waveform stored in LUT output `n`.
 
         :param n: Which generator to target.
         :type n: int
 
-        :return: waveform
+        :param as_complex: If True, return complex values. If False, return
+            the raw I and Q integers.
+        :type as_complex: bool
+
+        :return: waveform. If ``as_complex``, as complex64 values. Since the
+            LUT stores 16-bit integers these are represented exactly.
+            Otherwise, as an int16 array with shape [2, n_samples], where the
+            first row holds I samples and the second Q samples.
         :rtype: numpy.ndarray
         """
         realraw = self.read(f'{n}_i', self.n_samples*2)
         imagraw = self.read(f'{n}_q', self.n_samples*2)
-        real = np.frombuffer(realraw, dtype='>i2')
-        imag = np.frombuffer(imagraw, dtype='>i2')
-        return real + 1j*imag
+        if not as_complex:
+            out = np.empty([2, self.n_samples], dtype=np.int16)
+            out[0] = np.frombuffer(realraw, dtype='>i2')
+            out[1] = np.frombuffer(imagraw, dtype='>i2')
+            return out
+        out = np.empty(self.n_samples, dtype=np.complex64)
+        # Assigning the big-endian data byteswaps and casts in one pass
+        out.real = np.frombuffer(realraw, dtype='>i2')
+        out.imag = np.frombuffer(imagraw, dtype='>i2')
+        return out
 
     def set_output_freq(self, n, freq_hz, sample_rate_hz=2457600000,
                         amplitude=None, round_freq=True, window=False):
@@ -122,17 +245,21 @@ class Generator(Block):
         :type window: bool
         """
         if amplitude is None:
-            amplitude = 0.95 * (1 - 1/2**self._n_bp) # 95% max scale
+            amplitude = self._default_amp
 
+        if self.n_generators is None:
+            self._get_block_params()
         if n == -1:
-           if self.n_generators is None:
-               self._get_block_params()
-           for i in range(self.n_generators):
-               self.set_output_freq(i, freq_hz, sample_rate_hz=sample_rate_hz,
-                                    amplitude=amplitude, round_freq=round_freq, window=window)
-           return
+            gens = range(self.n_generators)
+        else:
+            gens = [n]
         if self.n_samples > 1:
-            t = np.arange(self.n_samples) / sample_rate_hz
+            # Skip generators which already hold this waveform
+            params = (freq_hz, sample_rate_hz, amplitude, round_freq, window)
+            gens = [g for g in gens if self._lut_params.get(g) != params]
+            if len(gens) == 0:
+                self.logger.debug('Requested LUT waveform is already loaded')
+                return
             if round_freq:
                 freq_step_hz = sample_rate_hz / self.n_samples
                 freq_round_hz = round(freq_hz / freq_step_hz) * freq_step_hz
@@ -140,16 +267,112 @@ class Generator(Block):
                 if round_delta != 0:
                     self.logger.info(f"Rounded frequency from {freq_hz} to {freq_round_hz} to make continuous circular waveform (delta {round_delta})")
                     freq_hz = freq_round_hz
-            x = np.exp(1j*2*np.pi*freq_hz*t) * amplitude
+            if round_freq:
+                # Generate the tone by repeatedly rotating a single phasor,
+                # which needs only one complex exponential.
+                x = np.full(self.n_samples, np.exp(1j*2*np.pi*freq_hz/sample_rate_hz))
+                x[0] = amplitude
+                np.cumprod(x, out=x)
+            else:
+                t = self._get_sample_times(sample_rate_hz)
+                phase = np.multiply(2*np.pi*freq_hz, t, out=self._phase_buf)
+                x = np.empty(self.n_samples, dtype=complex)
+                np.cos(phase, out=x.real)
+                np.sin(phase, out=x.imag)
+                x *= amplitude
             if window:
                 self.logger.info("Appling Hann window")
-                x *= np.hanning(self.n_samples)
-            self.set_lut_output(n, x)
+                if self._hann is None or self._hann.shape[0] != self.n_samples:
+                    self._hann = np.hanning(self.n_samples)
+                x *= self._hann
+            # The waveform is the same for every generator, so only compute
+            # and encode it once
+            lut = self._format_lut_output(x)
+            for g in gens:
+                self._write_lut_output(g, *lut, params=params)
         else:
             phase_step = 2*np.pi * freq_hz / sample_rate_hz
-            self.set_cordic_output(n, phase_step, amplitude)
+            loaded = [self.set_cordic_output(g, phase_step, amplitude, reset=False) for g in gens]
+            # Leave the running outputs alone if no generator was changed
+            if any(loaded):
+                self.reset_phase()
+
+    def set_output_freqs(self, n, freqs_hz, amplitudes, phases=None,
+                         sample_rate_hz=2457600000, round_freq=True):
+        """
+        Set a LUT output to the sum of multiple CW tones.
+
+        :param n: Which generator to target. Use -1 to mean "all"
+        :type n: int
+
+        :param freqs_hz: Output frequencies, in Hz
+        :type freqs_hz: list or numpy.ndarray
+
+        :param amplitudes: Amplitude of each tone. If a single number, use this
+            amplitude for all tones. If the summed waveform overflows the LUT
+            range it is scaled down to fit.
+        :type amplitudes: float, list or numpy.ndarray
+
+        :param phases: Starting phase of each tone, in radians. If None, all tones
+            start with zero phase.
+        :type phases: list or numpy.ndarray
+
+        :param sample_rate_hz: DAC sample rate, in Hz
+        :type sample_rate_hz: float
+
+        :param round_freq: If True, round each of ``freqs_hz`` to the nearest frequency which
+            can be represented with a ``self.n_samples`` circular buffer.
+        :type round_freq: bool
+        """
+        if self.n_generators is None:
+            self._get_block_params()
+        if self.n_samples <= 1:
+            self.logger.error('Multi-tone outputs are only supported by LUT generators')
+            return
+        if n == -1:
+            gens = range(self.n_generators)
+        else:
+            gens = [n]
+        freqs_hz = np.array(freqs_hz, dtype=float)
+        n_tones = len(freqs_hz)
+        amplitudes = np.broadcast_to(np.asarray(amplitudes, dtype=float), n_tones)
+        if phases is None:
+            phases = np.zeros(n_tones)
+        phases = np.broadcast_to(np.asarray(phases, dtype=float), n_tones)
+        if round_freq:
+            freq_step_hz = sample_rate_hz / self.n_samples
+            freqs_hz = np.round(freqs_hz / freq_step_hz) * freq_step_hz
+        if HAS_NUMBA:
+            x = np.empty(self.n_samples, dtype=complex)
+            _fill_multi_tone(freqs_hz, np.ascontiguousarray(amplitudes),
+                             np.ascontiguousarray(phases), float(sample_rate_hz), x)
+        else:
+            # Sum the tones with a single [samples x tones] matrix product
+            t = self._get_sample_times(sample_rate_hz)
+            x = np.exp(1j * np.outer(t, 2 * np.pi * freqs_hz)) @ (amplitudes * np.exp(1j * phases))
+        lut = self._format_lut_output(x)
+        for g in gens:
+            self._write_lut_output(g, *lut)
 
-    def set_cordic_output(self, n, p, amplitude=None):
+    def _get_sample_times(self, sample_rate_hz):
+        """
+        Get the times of the samples in a LUT buffer, reusing the
+        values computed by previous calls where possible.
+
+        :param sample_rate_hz: DAC sample rate, in Hz
+        :type sample_rate_hz: float
+
+        :return: Sample times, in seconds
+        :rtype: numpy.ndarray
+        """
+        if self._t is None or self._t_sample_rate_hz != sample_rate_hz \
+                or self._t.shape[0] != self.n_samples:
+            self._t = np.arange(self.n_samples) / sample_rate_hz
+            self._t_sample_rate_hz = sample_rate_hz
+            self._phase_buf = np.empty(self.n_samples, dtype=float)
+        return self._t
+
+    def set_cordic_output(self, n, p, amplitude=None, reset=True):
         """
         Set CORDIC output `n` to increment by phase `p` every sample.
 
@@ -162,27 +385,64 @@ class Generator(Block):
         :param amplitude: Set the output of amplitude of the CW signal. If not provided,
             use maximum scale.
         :type amplitude: float
+
+        :param reset: If True, reset the phase of the outputs after loading the new
+            settings. Set to False when configuring several generators, and call
+            `reset_phase` once after the last.
+        :type reset: bool
+
+        :return: True if the generator was configured, False if the request
+            was rejected.
+        :rtype: bool
         """
         if amplitude is None:
-            amplitude = 0.95 * (1 - 1/2**self._n_bp) # 95% max scale
+            amplitude = self._default_amp
 
         if self.n_generators is None:
             self._get_block_params()
         if n >= self.n_generators:
             self.logger.error(f'Requested generator {n}, but only {self.n_generators} are provided')
-            return
+            return False
         if self.n_samples > 1:
             self.logger.error('This is a LUT generator, and provides no CORDIC capabilities')
-            return
+            return False
+        # Outputs are (re)started by the phase reset below, so the order
+        # in which these registers are loaded doesn't matter
+        self.write_int_many(self._format_cordic_output(n, p, amplitude))
+        if reset:
+            self.reset_phase()
+        return True
+
+    def _format_cordic_output(self, n, p, amplitude):
+        """
+        Get the register writes which set CORDIC output `n` to increment by
+        phase `p` every sample.
+
+        :param n: Which generator to target.
+        :type n: int
+
+        :param p: phase increment, in units of radians
+        :type p: float
+
+        :param amplitude: Amplitude of the CW signal.
+        :type amplitude: float
+
+        :return: List of (register, value) tuples, suitable for passing to `write_int_many`
+        :rtype: list
+        """
         # phase should be in units of pi radians, and in range +/-1
         phase_scaled = p / np.pi
         phase_scaled = ((phase_scaled + 1) % 2) - 1
-        phase_scaled = int(phase_scaled * 2**63)
-        self.write_int(f'{n}_phase_inc_msb', (phase_scaled >> 32) & 0xffffffff)
-        self.write_int(f'{n}_phase_inc_lsb', phase_scaled & 0xffffffff)
-        amp_scaled = int(amplitude * 2**self._n_bp)
-        self.write_int(f'{n}_amplitude', amp_scaled)
-        self.reset_phase()
+        phase_scaled = int(phase_scaled * self._phase_scale)
+        # Split into 32-bit words for the MSB and LSB registers. The wrapped
+        # phase is always in [-2**63, 2**63), so packs directly as a signed int64.
+        msb, lsb = struct.unpack('>II', struct.pack('>q', phase_scaled))
+        amp_scaled = int(amplitude * self._scale)
+        return [
+            (f'{n}_phase_inc_msb', msb),
+            (f'{n}_phase_inc_lsb', lsb),
+            (f'{n}_amplitude', amp_scaled),
+        ]
 
     def get_cordic_overflows(self):
         """
@@ -212,12 +472,22 @@ class Generator(Block):
             If True, do nothing. If False, reset phase and generator contents
         :type read_only: bool
         """
-        self._get_block_params()
+        # Block parameters are fixed at compile time, and blocks are recreated
+        # when new firmware is programmed, so only re-read them if
+        # this failed on instantiation.
+        if self.n_generators is None:
+            self._get_block_params()
         if read_only:
             return
-        for g in range(self.n_generators):
-            if self.n_samples > 1:
-                self.set_lut_output(g, np.zeros(self.n_samples, dtype=complex))
-            else:
-                self.set_cordic_output(g, 0)
+        if self.n_samples > 1:
+            # A zeroed LUT is all-zero bytes, so skip the sample formatting
+            zeros = bytes(2 * self.n_samples)
+            for g in range(self.n_generators):
+                self._write_lut_output(g, zeros, zeros)
+        else:
+            # Load every CORDIC in one batch, and reset phases once at the end
+            writes = []
+            for g in range(self.n_generators):
+                writes += self._format_cordic_output(g, 0, self._default_amp)
+            self.write_int_many(writes)
         self.reset_phase()
@@ -1,7 +1,101 @@
+import math
 import struct
 import numpy as np
 from .block import Block
-from ..helpers import cplx2uint
+from ..helpers import cplx2uint, cplx2uint_array, njit, prange, HAS_NUMBA
+
+@njit(parallel=True, cache=True)
+def _wrap_phase(phase, scale, out):
+    """
+    Wrap phases to the range -pi to pi and convert to fixed point, in
+    a single pass without intermediate arrays.
+
+    :param phase: Phases, in radians
+    :type phase: numpy.ndarray
+
+    :param scale: Fixed-point value corresponding to a phase of pi radians
+    :type scale: float
+
+    :param out: Integer array into which formatted phases are written
+    :type out: numpy.ndarray
+    """
+    for i in prange(phase.shape[0]):
+        x = phase[i] / np.pi
+        # Conversion to integer truncates towards zero
+        out[i] = int((x - 2.0 * np.floor(0.5 * x + 0.5)) * scale)
+
+@njit(cache=True)
+def _format_channel_words(phase, phase_offset, phase_scale, phase_offset_scale, n_ri_step_bits):
+    """
+    Compute the phase increment, phase offset and per-sample rotation register
+    values for a single channel. This gives the same results as formatting the
+    channel with ``Mixer._format_phase_step`` and ``cplx2uint``, without the
+    overhead of numpy calls on scalar values.
+
+    :param phase: Phase increment, in radians
+    :type phase: float
+
+    :param phase_offset: Phase offset, in radians
+    :type phase_offset: float
+
+    :param phase_scale: Fixed-point phase increment corresponding to pi radians
+    :type phase_scale: float
+
+    :param phase_offset_scale: Fixed-point phase offset corresponding to pi radians
+    :type phase_offset_scale: float
+
+    :param n_ri_step_bits: Number of bits in each of the real/imag rotation values
+    :type n_ri_step_bits: int
+
+    :return: (phase_int, phase_offset_int, ri_step_int)
+    :rtype: (int, int, int)
+    """
+    x = phase / math.pi
+    phase_int = int((x - 2.0 * math.floor(0.5 * x + 0.5)) * phase_scale)
+    x = phase_offset / math.pi
+    phase_offset_int = int((x - 2.0 * math.floor(0.5 * x + 0.5)) * phase_offset_scale)
+    ri_scale = 1 << (n_ri_step_bits - 1)
+    mask = (1 << n_ri_step_bits) - 1
+    real = min(round(math.cos(phase) * ri_scale), ri_scale - 1)
+    imag = min(round(math.sin(phase) * ri_scale), ri_scale - 1)
+    ri_step_int = ((real & mask) << n_ri_step_bits) | (imag & mask)
+    return phase_int, phase_offset_int, ri_step_int
+
+@njit(parallel=True, cache=True)
+def _format_channels(phase, phase_offset, phase_scale, phase_offset_scale, n_ri_step_bits,
+                     phase_out, phase_offset_out, ri_step_out):
+    """
+    Compute the phase increment, phase offset and per-sample rotation register
+    values for many channels in a single pass, without the intermediate arrays
+    of the equivalent numpy calls.
+
+    :param phase: Phase increments, in radians
+    :type phase: numpy.ndarray
+
+    :param phase_offset: Phase offsets, in radians
+    :type phase_offset: numpy.ndarray
+
+    :param phase_scale: Fixed-point phase increment corresponding to pi radians
+    :type phase_scale: float
+
+    :param phase_offset_scale: Fixed-point phase offset corresponding to pi radians
+    :type phase_offset_scale: float
+
+    :param n_ri_step_bits: Number of bits in each of the real/imag rotation values
+    :type n_ri_step_bits: int
+
+    :param phase_out: Integer array into which phase increments are written
+    :type phase_out: numpy.ndarray
+
+    :param phase_offset_out: Integer array into which phase offsets are written
+    :type phase_offset_out: numpy.ndarray
+
+    :param ri_step_out: Integer array into which rotation values are written
+    :type ri_step_out: numpy.ndarray
+    """
+    for i in prange(phase.shape[0]):
+        phase_out[i], phase_offset_out[i], ri_step_out[i] = _format_channel_words(
+            phase[i], phase_offset[i], phase_scale, phase_offset_scale, n_ri_step_bits)
 
 class Mixer(Block):
     """
@@ -66,7 +160,16 @@ class Mixer(Block):
         self._phase_offset_bp = phase_offset_bp
         self._n_scale_bits = n_scale_bits
         self._n_ri_step_bits = n_ri_step_bits
+        # Fixed-point scaling constants
+        self._phase_scale = float(1 << phase_bp) # phase_inc value for pi radians
+        self._phase_offset_scale = float(1 << phase_offset_bp) # phase_offset value for pi radians
+        self._amp_scale = float(1 << n_scale_bits) # scale value for unity gain
+        self._amp_scale_max = (1 << n_scale_bits) - 1 # Largest scale value
         self.n_phase_slots = n_phase_slots
+        self._fft_rbw_cache = None # (sample_rate_hz, fft_rbw_hz) of last RBW calculation
+        # Values last written to individual register words by set_phase_step,
+        # keyed by (register, word offset)
+        self._last_written = {}
 
     def enable_power_mode(self):
         """
@@ -91,6 +194,33 @@ class Mixer(Block):
         """
         return bool(self.read_int('power_en'))
 
+    def _get_fft_rbw_hz(self, sample_rate_hz):
+        """
+        Get the width of an upstream FFT channel.
+
+        :param sample_rate_hz: DAC sample rate, in Hz
+        :type sample_rate_hz: float
+
+        :return: FFT channel width, in Hz
+        :rtype: float
+        """
+        # The sample rate rarely changes, so cache the result for the last one used
+        if self._fft_rbw_cache is None or self._fft_rbw_cache[0] != sample_rate_hz:
+            fft_period_s = self._n_upstream_chans / self._upstream_oversample_factor / sample_rate_hz
+            self._fft_rbw_cache = (sample_rate_hz, 1./fft_period_s)
+        return self._fft_rbw_cache[1]
+
+    def _check_los(self, los):
+        """
+        Check that a list of LOs is valid, raising ValueError if not.
+
+        :param los: List of LOs. Can contain 'rx' and 'tx'
+        :type los: list
+        """
+        for lo in los:
+            if lo not in ['rx', 'tx']:
+                raise ValueError(f"Only LOs 'rx' and 'tx' are understood. Not {lo}.")
+
     def set_chan_freq(self, chan, freq_offset_hz=None, phase_offset=0, sample_rate_hz=2500000000):
         """
         Set the frequency of output channel `chan`.
@@ -113,8 +243,7 @@ class Mixer(Block):
         if freq_offset_hz is None:
             phase_step = None
         else:
-            fft_period_s = self._n_upstream_chans / self._upstream_oversample_factor / sample_rate_hz
-            fft_rbw_hz = 1./fft_period_s # FFT channel width, Hz
+            fft_rbw_hz = self._get_fft_rbw_hz(sample_rate_hz)
             phase_step = freq_offset_hz / fft_rbw_hz * 2 * np.pi
         self.set_phase_step(chan, phase=phase_step, phase_offset=phase_offset)
 
@@ -129,18 +258,12 @@ class Mixer(Block):
         :return: Integer scale[s]
         :rtype: int or array of ints
         """
-        is_array = isinstance(v, np.ndarray)
-        if not is_array:
-            v = np.array([v], dtype=float)
-        v *= 2**self._n_scale_bits
-        v = np.array(np.round(v), dtype=int)
-        # saturate
-        scale_max = 2**self._n_scale_bits - 1
-        v[v > scale_max] = scale_max
-        if is_array:
-            return v
+        # Round and saturate in one pass, without modifying the caller's array
+        out = np.clip(np.rint(np.multiply(v, self._amp_scale, dtype=float)), 0, self._amp_scale_max).astype(int)
+        if isinstance(v, np.ndarray):
+            return out
         else:
-            return v[0]
+            return int(out)
 
     def set_amplitude_scale(self, chan, scale=1.0, los=['rx', 'tx']):
         """
@@ -160,12 +283,69 @@ class Mixer(Block):
         s = chan // self._n_parallel_chans # Serial channel position
         assert scale >= 0
         scale = self._format_amp_scale(scale)
+        self._check_los(los)
         for lo in los:
-            if lo not in ['rx', 'tx']:
-                raise ValueError(f"Only LOs 'rx' and 'tx' are understood. Not {lo}.")
             regname = f'{lo}_lo{p}_scale'
             self.write_int(regname, scale, word_offset=s)
 
+    def set_amplitude_scales(self, scales, los=['rx', 'tx']):
+        """
+        Apply amplitude scalings <=1 to all output channels. This is
+        equivalent to calling ``set_amplitude_scale`` for every channel,
+        but writes each register as a single block.
+
+        :param scales: Scalings to apply, one per channel.
+        :type scales: numpy.ndarray
+
+        :param los: List of LOs to write to. Can be ['rx'], ['tx'] or ['rx', 'tx']
+        :type los: list
+
+        """
+        scales = np.array(scales, dtype=float)
+        assert len(scales) == self.n_chans, f'Must provide {self.n_chans} scales'
+        assert np.all(scales >= 0)
+        scales = self._split_streams(self._format_amp_scale(scales), '>u4')
+        writes = []
+        self._check_los(los)
+        for i in range(self._n_parallel_chans):
+            # The same payload goes to every LO, so only build it once
+            scale_bytes = scales[i].tobytes()
+            for lo in los:
+                writes += [(f'{lo}_lo{i}_scale', scale_bytes)]
+        self.write_many(writes)
+
+    @staticmethod
+    def _wrap(x):
+        """
+        Wrap values into the range -1 to 1. Unlike ``((x + 1) % 2) - 1``
+        this needs no modulo, and doesn't lose the precision of small
+        values in the intermediate ``x + 1``.
+
+        :param x: Values to wrap
+        :type x: numpy.ndarray
+
+        :return: Wrapped values
+        :rtype: numpy.ndarray
+        """
+        return x - 2.0 * np.floor(0.5 * x + 0.5)
+
+    @staticmethod
+    def _unit_phasors(phase):
+        """
+        Compute ``cos(phase) + 1j*sin(phase)``, writing the cosines and sines
+        straight into the output rather than via temporary arrays.
+
+        :param phase: Phases, in radians
+        :type phase: numpy.ndarray
+
+        :return: Complex unit phasors
+        :rtype: numpy.ndarray
+        """
+        out = np.empty(np.shape(phase), dtype=complex)
+        np.cos(phase, out=out.real)
+        np.sin(phase, out=out.imag)
+        return out
+
     def _format_phase_step(self, phase, phase_offset):
         """
         Given a desired phase step and offset, format each as appropriate
@@ -189,17 +369,16 @@ class Mixer(Block):
             phase_offset = np.array([phase_offset])
         n_tone = len(phase)
         assert len(phase_offset) == n_tone
-        phase_int = np.zeros(len(phase), dtype='i4')
-        phase_offset_int = np.zeros(len(phase_offset), dtype='i4')
-        for i in range(n_tone):
-            phase_scaled = phase[i] / np.pi # units of pi rads
-            phase_scaled = ((phase_scaled + 1) % 2) - 1 # -pi to pi
-            phase_scaled = int(phase_scaled * 2**self._phase_bp)
-            phase_int[i] = phase_scaled
-            phase_offset_scaled = phase_offset[i] / np.pi # units of pi rads
-            phase_offset_scaled = ((phase_offset_scaled + 1) % 2) - 1 # -pi to pi
-            phase_offset_scaled = int(phase_offset_scaled * 2**self._phase_offset_bp)
-            phase_offset_int[i] = phase_offset_scaled
+        if HAS_NUMBA:
+            phase_int = np.empty(n_tone, dtype='i4')
+            phase_offset_int = np.empty(n_tone, dtype='i4')
+            _wrap_phase(np.asarray(phase, dtype=float), self._phase_scale, phase_int)
+            _wrap_phase(np.asarray(phase_offset, dtype=float), self._phase_offset_scale, phase_offset_int)
+        else:
+            # Convert to units of pi rads, wrapped to -pi to pi. Casting
+            # to integer truncates towards zero, like python's int()
+            phase_int = (self._wrap(phase / np.pi) * self._phase_scale).astype('i4')
+            phase_offset_int = (self._wrap(phase_offset / np.pi) * self._phase_offset_scale).astype('i4')
         if is_array:
             return phase_int, phase_offset_int
         else:
@@ -228,22 +407,87 @@ class Mixer(Block):
         p = chan % self._n_parallel_chans  # Parallel stream number
         s = chan // self._n_parallel_chans # Serial channel position
         if phase is None:
-            phase = 0
-            phase_scaled = 0
-            phase_offset_scaled = 0
-        else:
-            phase_scaled, phase_offset_scaled = self._format_phase_step(phase, phase_offset)
-        ri_step_scaled = cplx2uint(np.cos(phase) + 1j*np.sin(phase), self._n_ri_step_bits)
+            phase = 0.0
+            phase_offset = 0.0
+        phase_scaled, phase_offset_scaled, ri_step_scaled = _format_channel_words(
+            float(phase), float(phase_offset), self._phase_scale,
+            self._phase_offset_scale, self._n_ri_step_bits)
+        writes = []
+        self._check_los(los)
         for lo in los:
-            if lo not in ['rx', 'tx']:
-                raise ValueError(f"Only LOs 'rx' and 'tx' are understood. Not {lo}.")
             inc_regname = f'{lo}_lo{p}_phase_inc'
             offset_regname = f'{lo}_lo{p}_phase_offset'
             ri_step_regname = f'{lo}_lo{p}_ri_step'
-            self.write_int(inc_regname, phase_scaled, word_offset=s)
-            self.write_int(offset_regname, phase_offset_scaled, word_offset=s)
-            self.write_int(ri_step_regname, ri_step_scaled, word_offset=s)
+            writes += [
+                (inc_regname, phase_scaled, s),
+                (offset_regname, phase_offset_scaled, s),
+                (ri_step_regname, ri_step_scaled, s),
+            ]
+        # Skip words which already hold the requested values
+        writes = [w for w in writes if self._last_written.get((w[0], w[2])) != w[1]]
+        # Only a handful of words, so write them directly rather than via a thread pool
+        for reg, val, s in writes:
+            if self.write_int(reg, val, word_offset=s):
+                self._last_written[(reg, s)] = val
+
+    def invalidate_cache(self):
+        """
+        Forget the register values remembered by ``set_phase_step`` and
+        ``set_phase_switch_pattern``, so that subsequent calls write to
+        hardware unconditionally. Call this
+        if the mixer registers have been modified other than through this
+        object (e.g. by reprogramming the FPGA, or from another process).
+        """
+        self._last_written = {}
  
+    def set_phase_steps(self, phases, phase_offsets=None, los=['rx', 'tx']):
+        """
+        Set the phase increment to apply on each successive sample for
+        all channels. This is equivalent to calling ``set_phase_step``
+        for every channel, but writes each register as a single block.
+
+        :param phases: The phase increments to be added each successive sample
+            in units of radians. One value per channel.
+        :type phases: numpy.ndarray
+
+        :param phase_offsets: The phase offsets at which oscillators should start
+            in units of radians. One value per channel. If None, use zero.
+        :type phase_offsets: numpy.ndarray
+
+        :param los: List of LOs to write to. Can be ['rx'], ['tx'] or ['rx', 'tx']
+        :type los: list
+
+        """
+        phases = np.array(phases, dtype=float)
+        assert len(phases) == self.n_chans, f'Must provide {self.n_chans} phase steps'
+        if phase_offsets is None:
+            phase_offsets = np.zeros(self.n_chans)
+        else:
+            phase_offsets = np.array(phase_offsets, dtype=float)
+            assert len(phase_offsets) == self.n_chans, f'Must provide {self.n_chans} phase offsets'
+        ri_steps = self._unit_phasors(phases)
+        phase_steps, phase_offsets = self._format_phase_step(phases, phase_offsets)
+        ri_steps = cplx2uint_array(ri_steps, self._n_ri_step_bits)
+        # format appropriately
+        phase_steps = self._split_streams(phase_steps, '>i4')
+        phase_offsets = self._split_streams(phase_offsets, '>i4')
+        ri_steps = self._split_streams(ri_steps, '>u4')
+        writes = []
+        self._check_los(los)
+        for i in range(self._n_parallel_chans):
+            phase_step_bytes = phase_steps[i].tobytes()
+            phase_offset_bytes = phase_offsets[i].tobytes()
+            ri_step_bytes = ri_steps[i].tobytes()
+            for lo in los:
+                regprefix = f'{lo}_lo{i}'
+                writes += [
+                    (regprefix + '_phase_inc', phase_step_bytes),
+                    (regprefix + '_phase_offset', phase_offset_bytes),
+                    (regprefix + '_ri_step', ri_step_bytes),
+                ]
+        self.invalidate_cache()
+        self.write_many(writes)
+
     def get_phase_offset(self, chan, lo='rx'):
         """
         Get the currently loaded phase increment being applied to channel `chan`.
@@ -259,17 +503,16 @@ class Mixer(Block):
         """
         p = chan % self._n_parallel_chans  # Parallel stream number
         s = chan // self._n_parallel_chans # Serial channel position
-        if lo not in ['rx', 'tx']:
-            raise ValueError(f"Only LOs 'rx' and 'tx' are understood. Not {lo}.")
+        self._check_los([lo])
         inc_regname = f'{lo}_lo{p}_phase_inc'
         offset_regname = f'{lo}_lo{p}_phase_offset'
         scale_regname = f'{lo}_lo{p}_scale'
         # Increment-per-clock
-        inc_val = self.read_int(inc_regname, word_offset=s) / 2**self._phase_bp * np.pi
+        inc_val = self.read_int(inc_regname, word_offset=s) / self._phase_scale * np.pi
         # Now phase offset
-        phase_offset = self.read_int(offset_regname, word_offset=s) / 2**self._phase_offset_bp * np.pi
+        phase_offset = self.read_int(offset_regname, word_offset=s) / self._phase_offset_scale * np.pi
         # Finally scale
-        scale = self.read_uint(scale_regname, word_offset=s) / 2**self._n_scale_bits
+        scale = self.read_uint(scale_regname, word_offset=s) / self._amp_scale
         return inc_val, phase_offset, scale
 
     def set_freqs(self, freqs_hz, phase_offsets, scaling=1.0, sample_rate_hz=2500000000, los=['rx', 'tx']):
@@ -285,6 +528,7 @@ class Mixer(Block):
 
         :param scaling: optional scaling (<=1) to apply to the output tone
             amplitudes. If a single number, apply this scale to all tones.
+            If None, leave the currently loaded scales unchanged.
         :type scaling: np.ndarray
 
         :param sample_rate_hz: DAC sample rate, in Hz
@@ -298,33 +542,156 @@ class Mixer(Block):
         n_tone = len(freqs_hz)
         phase_offsets = np.array(phase_offsets, dtype=float)
         assert len(phase_offsets) == n_tone
-        try:
+        if scaling is not None:
+            scaling = np.asarray(scaling, dtype=float)
+            if scaling.ndim == 0:
+                # A read-only view, which is fine since scaling is never modified in place
+                scaling = np.broadcast_to(scaling, (n_tone,))
             assert len(scaling) == n_tone
-            scaling = np.array(scaling)
-        except TypeError:
-            scaling = scaling * np.ones(n_tone, dtype=float)
+        if n_tone == self.n_chans and scaling is not None and \
+                not (freqs_hz.any() or phase_offsets.any() or scaling.any()):
+            # Disabling every channel needs no formatting
+            self._zero_all_phase_steps(los=los)
+            return
         
-        fft_period_s = self._n_upstream_chans / self._upstream_oversample_factor / sample_rate_hz
-        fft_rbw_hz = 1./fft_period_s # FFT channel width, Hz
+        fft_rbw_hz = self._get_fft_rbw_hz(sample_rate_hz)
         phase_steps = freqs_hz / fft_rbw_hz * 2 * np.pi
-        ri_steps = np.cos(phase_steps) + 1j*np.sin(phase_steps)
-        phase_steps, phase_offsets = self._format_phase_step(phase_steps, phase_offsets)
-        scaling = self._format_amp_scale(scaling)
-        ri_steps = [cplx2uint(ri_step, self._n_ri_step_bits) for ri_step in ri_steps]
+        if HAS_NUMBA:
+            phase_ints = np.empty(n_tone, dtype='i4')
+            phase_offset_ints = np.empty(n_tone, dtype='i4')
+            ri_steps = np.empty(n_tone, dtype=np.int64)
+            _format_channels(phase_steps, phase_offsets, self._phase_scale, self._phase_offset_scale,
+                             self._n_ri_step_bits, phase_ints, phase_offset_ints, ri_steps)
+            phase_steps, phase_offsets = phase_ints, phase_offset_ints
+        else:
+            ri_steps = self._unit_phasors(phase_steps)
+            phase_steps, phase_offsets = self._format_phase_step(phase_steps, phase_offsets)
+            ri_steps = cplx2uint_array(ri_steps, self._n_ri_step_bits)
         # format appropriately
-        phase_steps = np.array(phase_steps, dtype='>i4')
-        phase_offsets = np.array(phase_offsets, dtype='>i4')
-        scaling = np.array(scaling, dtype='>u4')
-        ri_steps = np.array(ri_steps, dtype='>u4')
+        phase_steps = self._split_streams(phase_steps, '>i4')
+        phase_offsets = self._split_streams(phase_offsets, '>i4')
+        ri_steps = self._split_streams(ri_steps, '>u4')
+        if scaling is not None:
+            scaling = self._split_streams(self._format_amp_scale(scaling), '>u4')
+        writes = []
+        self._check_los(los)
         for i in range(min(self._n_parallel_chans, n_tone)):
+            if scaling is not None:
+                scale_bytes = scaling[i].tobytes()
+            phase_step_bytes = phase_steps[i].tobytes()
+            phase_offset_bytes = phase_offsets[i].tobytes()
+            ri_step_bytes = ri_steps[i].tobytes()
             for lo in los:
-                if lo not in ['rx', 'tx']:
-                    raise ValueError(f"Only LOs 'rx' and 'tx' are understood. Not {lo}.")
                 regprefix = f'{lo}_lo{i}'
-                self.write(regprefix + '_scale', scaling[i::self._n_parallel_chans].tobytes())
-                self.write(regprefix + '_phase_inc', phase_steps[i::self._n_parallel_chans].tobytes())
-                self.write(regprefix + '_phase_offset', phase_offsets[i::self._n_parallel_chans].tobytes())
-                self.write(regprefix + '_ri_step', ri_steps[i::self._n_parallel_chans].tobytes())
+                if scaling is not None:
+                    writes += [(regprefix + '_scale', scale_bytes)]
+                writes += [
+                    (regprefix + '_phase_inc', phase_step_bytes),
+                    (regprefix + '_phase_offset', phase_offset_bytes),
+                    (regprefix + '_ri_step', ri_step_bytes),
+                ]
+        self.invalidate_cache()
+        self.write_many(writes)
+
+    def get_freqs(self, sample_rate_hz=2500000000, lo='rx'):
+        """
+        Get the currently loaded frequencies, phase offsets and amplitude
+        scales of all channels. This is the inverse of ``set_freqs``, and
+        reads each register in a single transaction.
+
+        :param sample_rate_hz: DAC sample rate, in Hz
+        :type sample_rate_hz: float
+
+        :param lo: Which LO to read. 'rx' or 'tx'
+        :type lo: str
+
+        :return: (freqs_hz, phase_offsets, scaling)
+            A tuple of arrays, each with one entry per channel, containing
+            the frequency offsets in Hz, the start phases in radians, and the
+            scale factors being applied.
+        :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        """
+        self._check_los([lo])
+        nbytes = 4 * self._n_serial_chans
+        reads = []
+        for i in range(self._n_parallel_chans):
+            regprefix = f'{lo}_lo{i}'
+            reads += [
+                (regprefix + '_phase_inc', nbytes),
+                (regprefix + '_phase_offset', nbytes),
+                (regprefix + '_scale', nbytes),
+            ]
+        raw = self.read_many(reads)
+        # Arrays of [n_serial_chans, n_parallel_chans], so that flattening
+        # gives channel order
+        phase_steps = np.empty([self._n_serial_chans, self._n_parallel_chans])
+        phase_offsets = np.empty([self._n_serial_chans, self._n_parallel_chans])
+        scaling = np.empty([self._n_serial_chans, self._n_parallel_chans])
+        for i in range(self._n_parallel_chans):
+            phase_steps[:, i] = np.frombuffer(raw[3*i], dtype='>i4')
+            phase_offsets[:, i] = np.frombuffer(raw[3*i + 1], dtype='>i4')
+            scaling[:, i] = np.frombuffer(raw[3*i + 2], dtype='>u4')
+        fft_rbw_hz = self._get_fft_rbw_hz(sample_rate_hz)
+        freqs_hz = phase_steps.ravel() * (fft_rbw_hz / (2 * self._phase_scale))
+        phase_offsets = phase_offsets.ravel() * (np.pi / self._phase_offset_scale)
+        scaling = scaling.ravel() / self._amp_scale
+        return freqs_hz, phase_offsets, scaling
+
+    def _split_streams(self, x, dtype=None):
+        """
+        Split an array of per-channel values into the values for each parallel
+        stream, with each stream's values stored contiguously.
+
+        :param x: Array of values, in channel order
+        :type x: numpy.ndarray
+
+        :param dtype: Data type of the output arrays. If None, use the type of `x`.
+            Conversion (e.g. to big-endian) happens as part of the same copy.
+        :type dtype: str
+
+        :return: List of `self._n_parallel_chans` arrays. Entry `i` contains
+            the values of channels `i`, `i + self._n_parallel_chans`, etc.
+        :rtype: list
+        """
+        x = np.asarray(x)
+        n = len(x)
+        n_full = n // self._n_parallel_chans
+        n_extra = n % self._n_parallel_chans
+        # Every element is assigned below (or trimmed off), so no need to zero-fill
+        streams = np.empty([self._n_parallel_chans, n_full + (n_extra > 0)], dtype=dtype or x.dtype)
+        # Transpose once, so that each stream is a contiguous row
+        streams[:, 0:n_full] = x[0:n_full * self._n_parallel_chans].reshape(n_full, self._n_parallel_chans).T
+        streams[0:n_extra, n_full:] = x[n_full * self._n_parallel_chans:, None]
+        return [streams[i, 0:(n - i + self._n_parallel_chans - 1) // self._n_parallel_chans]
+                for i in range(self._n_parallel_chans)]
+
+    def _zero_all_phase_steps(self, los=['rx', 'tx']):
+        """
+        Set every channel to have zero phase increment, zero phase offset
+        and zero amplitude scale. This is equivalent to calling
+        ``set_freqs`` with all-zero arguments, but writes precomputed
+        constant buffers rather than formatting each channel's values.
+
+        :param los: List of LOs to write to. Can be ['rx'], ['tx'] or ['rx', 'tx']
+        :type los: list
+
+        """
+        zero = bytes(self._n_serial_chans * 4)
+        # A zero phase step still has a unit per-sample rotation
+        ri_step = np.full(self._n_serial_chans, cplx2uint(1.0, self._n_ri_step_bits), dtype='>u4').tobytes()
+        writes = []
+        self._check_los(los)
+        for i in range(self._n_parallel_chans):
+            for lo in los:
+                regprefix = f'{lo}_lo{i}'
+                writes += [
+                    (regprefix + '_scale', zero),
+                    (regprefix + '_phase_inc', zero),
+                    (regprefix + '_phase_offset', zero),
+                    (regprefix + '_ri_step', ri_step),
+                ]
+        self.invalidate_cache()
+        self.write_many(writes)
 
     def set_phase_switch_pattern(self, pattern, spectra_per_step, los=['rx', 'tx'], n_blank=0):
         """
@@ -353,16 +720,29 @@ class Mixer(Block):
         spectra_per_cycle = n_slots_used * spectra_per_step
         pattern_full = np.zeros(self.n_phase_slots, dtype='>B')
         pattern_full[0:n_slots_used] = pattern[:]
-        assert np.all([x in [0,1] for x in pattern]), 'All pattern elements must be 1 or 0'
+        assert np.all(np.asarray(pattern) == pattern_full[0:n_slots_used]) and np.all(pattern_full <= 1), \
+            'All pattern elements must be 1 or 0'
 
+        self._check_los(los)
+        pattern_bytes = pattern_full.tobytes()
         for lo in los:
-            if lo not in ['rx', 'tx']:
-                raise ValueError(f"Only LOs 'rx' and 'tx' are understood. Not {lo}.")
-            self.write(f'{lo}_lo0_phase_inv_en', pattern_full.tobytes())
-            self.write_int(f'{lo}_lo0_last_spec_index_per_step', spectra_per_step-1)
-            self.write_int(f'{lo}_lo0_last_spec_index_cycle', spectra_per_cycle-1)
-            self.write_int(f'{lo}_lo0_last_spec_before_blank', self._n_serial_chans - 1 - n_blank)
-            self.write_int(f'{lo}_lo0_n_spectra_blank', n_blank)
+            writes = [
+                (f'{lo}_lo0_phase_inv_en', pattern_bytes),
+                (f'{lo}_lo0_last_spec_index_per_step', spectra_per_step-1),
+                (f'{lo}_lo0_last_spec_index_cycle', spectra_per_cycle-1),
+                (f'{lo}_lo0_last_spec_before_blank', self._n_serial_chans - 1 - n_blank),
+                (f'{lo}_lo0_n_spectra_blank', n_blank),
+            ]
+            for reg, val in writes:
+                # Skip registers which already hold the requested values
+                if self._last_written.get((reg, 0)) == val:
+                    continue
+                if isinstance(val, bytes):
+                    ok = self.write(reg, val)
+                else:
+                    ok = self.write_int(reg, val)
+                if ok:
+                    self._last_written[(reg, 0)] = val
 
     def get_phase_switch_pattern(self, lo='rx'):
         """
@@ -409,11 +789,9 @@ class Mixer(Block):
             return d
         nval = len(d) // self.n_chans
         ntime = ss.width_bits // 64
-        out = []
-        for i in range(nval // ntime):
-            for j in range(ntime):
-                out += [d[i * self.n_chans * ntime + j]]
-        return np.array(out)
+        # The first `ntime` samples of each block of `self.n_chans * ntime`
+        idx = np.arange(nval // ntime)[:, None] * (self.n_chans * ntime) + np.arange(ntime)
+        return d[idx.ravel()]
 
 
     def initialize(self, read_only=False):
@@ -429,5 +807,5 @@ class Mixer(Block):
             pass
         else:
             self.disable_power_mode()
-            self.set_freqs(np.zeros(self.n_chans), np.zeros(self.n_chans), np.zeros(self.n_chans))
+            self._zero_all_phase_steps()
             self.set_phase_switch_pattern([0], 1024) # Don't do any phase switching
@@ -1,28 +1,83 @@
 import numpy as np
-import struct
+import socket
 
 from .block import Block
 
+from ..helpers import njit, prange, HAS_NUMBA
+
 MAX_PACKET_SIZE_BYTES = 8192
 
-def _ip_to_int(ip):
+@njit(parallel=True, cache=True)
+def _pack_headers(last, valid, first, is_8_bit, is_time_fastest, n_chans, chan, feng_id, out):
+    """
+    Combine header fields into 64-bit packetizer header words, in a single
+    pass without intermediate arrays.
+
+    :param last: Last-block-in-packet flags
+    :type last: numpy.ndarray
+
+    :param valid: Data valid flags
+    :type valid: numpy.ndarray
+
+    :param first: First-block-in-packet flags
+    :type first: numpy.ndarray
+
+    :param is_8_bit: 8-bit data flags
+    :type is_8_bit: numpy.ndarray
+
+    :param is_time_fastest: Time-fastest payload ordering flags
+    :type is_time_fastest: numpy.ndarray
+
+    :param n_chans: Number of channels in each block's packet
+    :type n_chans: numpy.ndarray
+
+    :param chan: First channel of each block
+    :type chan: numpy.ndarray
+
+    :param feng_id: F-Engine ID of each block
+    :type feng_id: numpy.ndarray
+
+    :param out: uint64 array into which header words are written
+    :type out: numpy.ndarray
+    """
+    mask = np.uint64(0xffff)
+    for i in prange(out.shape[0]):
+        out[i] = (np.uint64(last[i]) << np.uint64(58)) \
+               | (np.uint64(valid[i]) << np.uint64(57)) \
+               | (np.uint64(first[i]) << np.uint64(56)) \
+               | (np.uint64(is_8_bit[i]) << np.uint64(49)) \
+               | (np.uint64(is_time_fastest[i]) << np.uint64(48)) \
+               | ((np.uint64(n_chans[i]) & mask) << np.uint64(32)) \
+               | ((np.uint64(chan[i]) & mask) << np.uint64(16)) \
+               | (np.uint64(feng_id[i]) & mask)
+
+def _ips_to_ints(ips):
     """
-    convert an IP string (eg '10.11.10.1') to a 32-bit binary
-    string, suitable for writing to an FPGA register.
+    convert a list of IP strings (eg ['10.11.10.1', ...]) to an
+    array of 32-bit integers, suitable for writing to FPGA
+    registers. Raises ValueError unless every address has
+    exactly four octets in the range 0-255.
     """
-    octets = list(map(int, ip.split('.')))
-    ip_int = (octets[0] << 24) + (octets[1] << 16) + (octets[2] << 8) + octets[3]
-    return ip_int
+    octets = [ip.split('.') for ip in ips]
+    for ip, o in zip(ips, octets):
+        if len(o) != 4:
+            raise ValueError("Invalid IP address %s" % ip)
+    try:
+        octets = np.array(octets, dtype=np.int64).reshape(-1, 4)
+    except ValueError:
+        raise ValueError("Invalid IP address in %s" % list(ips))
+    bad = np.flatnonzero(np.any((octets < 0) | (octets > 255), axis=1))
+    if len(bad) > 0:
+        raise ValueError("Invalid IP address %s" % ips[bad[0]])
+    # Shift each octet into place and sum, in one operation
+    return octets.astype(np.uint32) @ np.array([1 << 24, 1 << 16, 1 << 8, 1], dtype=np.uint32)
 
 def _int_to_ip(ip):
     """
     convert an IP integer (eg 0x0a0a0a01) to an
     IP string (eg '10.10.10.1')
     """
-    sl = [] # list of parts to be joined with dots
-    for i in range(4):
-        sl += ["%d" % ((ip >> (8*(3-i))) & 0xff)]
-    return '.'.join(sl)
+    return socket.inet_ntoa((ip & 0xffffffff).to_bytes(4, 'big'))
 
 class Packetizer(Block):
     """
@@ -87,13 +142,52 @@ class Packetizer(Block):
         self.full_data_rate_gbps = 8*self.sample_width * self.n_ants * self.sample_rate_hz / 1.0e9
         self.granularity = granularity
         self.n_slots = self.n_total_words // granularity
+        # Last contents written to each header BRAM, so unchanged entries
+        # needn't be rewritten
+        self._last_written = {}
+
+    def invalidate_cache(self):
+        """
+        Forget the header BRAM contents remembered from previous writes, so
+        that the next configuration is written to hardware in full. Call this
+        if the packetizer has been modified other than through this
+        object (e.g. by reprogramming the FPGA, or from another process).
+        """
+        self._last_written = {}
+
+    def _get_changed_write(self, reg, val):
+        """
+        Get the write needed to update a BRAM with an array, skipping entries
+        which are unchanged since the last write. Only the span from the
+        first to the last changed entry is written, in a single transaction.
+
+        :param reg: Name of the BRAM to write
+        :type reg: str
+
+        :param val: Array of values to write, starting at address 0
+        :type val: numpy.ndarray
+
+        :return: (reg, bytes, offset) tuple suitable for `write_many`, or None
+            if nothing has changed.
+        :rtype: tuple
+        """
+        last = self._last_written.get(reg)
+        if last is None or last.shape != val.shape:
+            return (reg, val.tobytes(), 0)
+        changed = np.flatnonzero(last != val)
+        if len(changed) == 0:
+            return None
+        start = changed[0]
+        stop = changed[-1] + 1
+        return (reg, val[start:stop].tobytes(), int(start) * val.itemsize)
 
     def _populate_headers(self, headers):
         """
         Populate the voltage mode packetizer header fields.
 
-        :param headers: A list of header dictionaries to populate
-        :type headers: list
+        :param headers: A list of header dictionaries to populate, or a
+            dictionary of arrays (see below).
+        :type headers: list or dict
 
         Entry `i` of the `headers` list is written to packetizer header BRAM index `i`.
         This represents the control word associated with the `i`th data sample block
@@ -113,32 +207,109 @@ class Packetizer(Block):
             traffic from multiple boards.
           - `dest_ip` : String, the destination IP of this data block (eg "10.10.10.100")
           - `dest_port` : integer, the destination UDP port of this data block.
+
+        Alternatively, `headers` may be a single dictionary with the same keys,
+        each holding an array with one entry per header BRAM index. In this
+        case `dest_ip` entries may be given either as strings or as integers.
         """
 
-        h_bytestr = b''
-        ip_bytestr = b''
-        port_bytestr = b''
-        for hn, h in enumerate(headers):
-            header_word = (int(h['last']) << 58) \
-                        + (int(h['valid']) << 57) \
-                        + (int(h['first']) << 56) \
-                        + (int(h['is_8_bit']) << 49) \
-                        + (int(h['is_time_fastest']) << 48) \
-                        + ((h['n_chans'] & 0xffff) << 32) \
-                        + ((h['chan'] & 0xffff) << 16) \
-                        + ((h['feng_id'] & 0xffff) << 0)
-            h_bytestr += struct.pack('>Q', header_word)
-            ip_bytestr += struct.pack('>I', _ip_to_int(h['dest_ip']))
-            port_bytestr += struct.pack('>I', h['dest_port'])
-
-        self.write('ips', ip_bytestr)
-        self.write('header', h_bytestr)
-        self.write('ports', port_bytestr)
-
-    def _read_headers(self, n_words=None):
+        if isinstance(headers, dict):
+            arrays = dict(headers)
+            ips = np.asarray(arrays['dest_ip'])
+            if ips.dtype.kind in 'UO':
+                # Usually only a few destinations are in use, so only convert each once
+                unique_ips, ip_index = np.unique(ips, return_inverse=True)
+                ips = _ips_to_ints(unique_ips)[ip_index.reshape(-1)]
+            arrays['dest_ip'] = ips
+        else:
+            # Gather each field into an array
+            n = len(headers)
+            keys = ['first', 'valid', 'last', 'is_8_bit', 'is_time_fastest', 'n_chans', 'chan',
+                    'feng_id', 'dest_port']
+            arrays = {k: np.fromiter((h[k] for h in headers), dtype=np.uint64, count=n) for k in keys}
+            arrays['dest_ip'] = _ips_to_ints([h['dest_ip'] for h in headers])
+        self._populate_headers_arrays(**arrays)
+
+    def _populate_headers_arrays(self, first, valid, last, is_8_bit, is_time_fastest,
+            n_chans, chan, feng_id, dest_ip, dest_port):
+        """
+        Populate the voltage mode packetizer header fields from arrays of
+        field values. This is the same as `_populate_headers`, but without
+        the need to build a dictionary per header entry. Each argument should
+        have one entry per header BRAM index.
+
+        :param first: Flags indicating each sample block is the first in a packet.
+        :type first: numpy.ndarray
+
+        :param valid: Flags indicating each sample block contains valid data.
+        :type valid: numpy.ndarray
+
+        :param last: Flags indicating each sample block is the last valid block in a packet.
+        :type last: numpy.ndarray
+
+        :param is_8_bit: Flags indicating each packet contains 8-bit data.
+        :type is_8_bit: numpy.ndarray
+
+        :param is_time_fastest: Flags indicating each packet has a payload in
+            channel [slowest] x time x polarization [fastest] order.
+        :type is_time_fastest: numpy.ndarray
+
+        :param n_chans: Number of channels in each data block's packet.
+        :type n_chans: numpy.ndarray
+
+        :param chan: First channel present in each data block.
+        :type chan: numpy.ndarray
+
+        :param feng_id: F-Engine ID of each block's data.
+        :type feng_id: numpy.ndarray
+
+        :param dest_ip: Destination IP of each data block, as an integer (eg 0x0a0a0a64).
+        :type dest_ip: numpy.ndarray
+
+        :param dest_port: Destination UDP port of each data block.
+        :type dest_port: numpy.ndarray
+        """
+        fields = [np.asarray(x).astype(np.uint64) for x in
+                  (last, valid, first, is_8_bit, is_time_fastest, n_chans, chan, feng_id)]
+        if HAS_NUMBA:
+            header_words = np.empty(len(fields[0]), dtype=np.uint64)
+            _pack_headers(*fields, header_words)
+        else:
+            last, valid, first, is_8_bit, is_time_fastest, n_chans, chan, feng_id = fields
+            header_words = (last << np.uint64(58)) \
+                         | (valid << np.uint64(57)) \
+                         | (first << np.uint64(56)) \
+                         | (is_8_bit << np.uint64(49)) \
+                         | (is_time_fastest << np.uint64(48)) \
+                         | ((n_chans & np.uint64(0xffff)) << np.uint64(32)) \
+                         | ((chan & np.uint64(0xffff)) << np.uint64(16)) \
+                         | ((feng_id & np.uint64(0xffff)) << np.uint64(0))
+
+        vals = {
+            'ips': np.asarray(dest_ip).astype('>u4'),
+            'header': header_words.astype('>u8'),
+            'ports': np.asarray(dest_port).astype('>u4'),
+        }
+        writes = [self._get_changed_write(reg, val) for reg, val in vals.items()]
+        writes = [w for w in writes if w is not None]
+        written = self.write_many(writes)
+        # Only remember contents which actually made it to hardware
+        for (reg, _, _), ok in zip(writes, written):
+            if ok:
+                self._last_written[reg] = vals[reg]
+
+    def _read_headers(self, n_words=None, as_arrays=False):
         """
         Get the header entries from one of this board's packetizers.
 
+        :param n_words: Number of header entries to read. If None, read all of them.
+        :type n_words: int
+
+        :param as_arrays: If True, return a dictionary of arrays, keyed by
+            header field, rather than a list of dictionaries. This avoids building
+            a dictionary per entry.
+        :type as_arrays: bool
+
         :return: headers
         :rtype: list
 
@@ -160,6 +331,9 @@ class Packetizer(Block):
             traffic from multiple boards.
           - `dest_ip` : String, the destination IP of this data block (eg "10.10.10.100")
           - `dest_port` : Integer, the destination IP of this data block
+
+        If `as_arrays` is True, the returned dictionary has the same keys, each
+        holding an array with one entry per header BRAM index.
         """
 
         if n_words is None:
@@ -167,24 +341,34 @@ class Packetizer(Block):
         hs_raw = self.read('header', 8*n_words)
         ips_raw = self.read('ips', 4*n_words)
         ports_raw = self.read('ports', 4*n_words)
-        hs = struct.unpack('>%dQ' % n_words, hs_raw)
-        ips = struct.unpack('>%dI' % n_words, ips_raw)
-        ports = struct.unpack('>%dI' % n_words, ports_raw)
-
-        headers = []
-        for dn, d in enumerate(hs):
-            headers += [{}]
-            headers[-1]['feng_id'] = (d >> 0) & 0xffff
-            headers[-1]['chans'] = (d >> 16) & 0xffff
-            headers[-1]['n_chans'] = (d >> 32) & 0xffff
-            headers[-1]['is_time_fastest'] = bool((d >> 48) & 1)
-            headers[-1]['is_8_bit'] = bool((d >> 49) & 1)
-            headers[-1]['first'] = bool((d >> 56) & 1)
-            headers[-1]['valid'] = bool((d >> 57) & 1)
-            headers[-1]['last'] = bool((d >> 58) & 1)
-            headers[-1]['dest_ip'] = _int_to_ip(ips[dn])
-            headers[-1]['dest_port'] = ports[dn]
-        return headers
+        hs = np.frombuffer(hs_raw, dtype='>u8').astype(np.uint64)
+        ips = np.frombuffer(ips_raw, dtype='>u4')
+        ports = np.frombuffer(ports_raw, dtype='>u4').astype(np.uint32)
+
+        # Usually only a few destinations are in use, so only format each once
+        unique_ips, ip_index = np.unique(ips, return_inverse=True)
+        ip_strs = np.array([_int_to_ip(int(ip)) for ip in unique_ips], dtype=str)
+
+        def bit(n):
+            return ((hs >> np.uint64(n)) & np.uint64(1)).astype(bool)
+        fields = {
+            'feng_id': ((hs >> np.uint64(0)) & np.uint64(0xffff)).astype(np.int64),
+            'chans': ((hs >> np.uint64(16)) & np.uint64(0xffff)).astype(np.int64),
+            'n_chans': ((hs >> np.uint64(32)) & np.uint64(0xffff)).astype(np.int64),
+            'is_time_fastest': bit(48),
+            'is_8_bit': bit(49),
+            'first': bit(56),
+            'valid': bit(57),
+            'last': bit(58),
+            'dest_ip': ip_strs[ip_index.reshape(-1)],
+            'dest_port': ports,
+        }
+        if as_arrays:
+            return fields
+        # Convert to python types in bulk, then build a dictionary per entry
+        keys = list(fields.keys())
+        columns = [fields[k].tolist() for k in keys]
+        return [dict(zip(keys, vals)) for vals in zip(*columns)]
 
     def get_packet_info(self, n_pkt_chans, n_chan_send, n_ant_send, occupation=0.985, chan_block_size=4):
         """
@@ -275,25 +459,21 @@ class Packetizer(Block):
         # would naturally be associated with, if data comes from the upstream reorder in
         # input x channel x time order.
         # It's then up to the user to put inputs / channels in these slots.
-        starts = []
-        payloads = []
-        indices = []
-        antchans = []
-        for i in range(n_ant_send):
-            packets_per_ant = n_chan_send // n_pkt_chans
-            for c in range(packets_per_ant):
-                packet_num = i*packets_per_ant + c
-                slot_num = packet_num * (req_slots_per_pkt + spare_slots_per_pkt)
-                slot_start = slot_num
-                slot_stop = slot_start + req_slots_per_pkt
-                word_start = slot_start * self.n_words_per_chan
-                word_stop = slot_stop * self.n_words_per_chan
-                antchan_start = n_ant_send * word_start // self.n_words_per_chan
-                antchan_stop = n_ant_send * word_stop // self.n_words_per_chan
-                starts += [slot_num]
-                payloads += [range(slot_start, slot_stop)]
-                indices += [range(word_start, word_stop)]
-                antchans += [range(antchan_start, antchan_stop)]
+        # Packets are numbered antenna-major, and are equally spaced
+        packet_num = np.arange(req_packets)
+        slot_start = packet_num * (req_slots_per_pkt + spare_slots_per_pkt)
+        slot_stop = slot_start + req_slots_per_pkt
+        word_start = slot_start * self.n_words_per_chan
+        word_stop = slot_stop * self.n_words_per_chan
+        antchan_start = n_ant_send * word_start // self.n_words_per_chan
+        antchan_stop = n_ant_send * word_stop // self.n_words_per_chan
+        # Convert to python ints before building range()s
+        slot_start, slot_stop, word_start, word_stop, antchan_start, antchan_stop = \
+            [x.tolist() for x in (slot_start, slot_stop, word_start, word_stop, antchan_start, antchan_stop)]
+        starts = slot_start
+        payloads = [range(*r) for r in zip(slot_start, slot_stop)]
+        indices = [range(*r) for r in zip(word_start, word_stop)]
+        antchans = [range(*r) for r in zip(antchan_start, antchan_stop)]
 
         return starts, payloads, indices, antchans
         
@@ -355,32 +535,38 @@ class Packetizer(Block):
         check_length(dest_ports, n_packets, 'dest_ports')
         check_length(nchans_per_packet, n_packets, 'chans_per_packet')
 
-        # generate template headers for all invalid data
-        headers = []
-        for i in range(self.n_slots):
-            headers += [{
-                'first': False,
-                'valid': False,
-                'last': False,
-                'is_8_bit': True,
-                'is_time_fastest': True,
-                'n_chans': 0,
-                'chan': 0,
-                'feng_id': 0,
-                'dest_ip': '0.0.0.0',
-                'dest_port': 0,
-                }]
-
+        # generate template headers for all invalid data, with one array per field.
+        # IPs are stored as integers, ready for `_populate_headers_arrays`
+        headers = {
+            'first': np.zeros(self.n_slots, dtype=bool),
+            'valid': np.zeros(self.n_slots, dtype=bool),
+            'last': np.zeros(self.n_slots, dtype=bool),
+            'is_8_bit': np.ones(self.n_slots, dtype=bool),
+            'is_time_fastest': np.ones(self.n_slots, dtype=bool),
+            'n_chans': np.zeros(self.n_slots, dtype=np.int64),
+            'chan': np.zeros(self.n_slots, dtype=np.int64),
+            'feng_id': np.zeros(self.n_slots, dtype=np.int64),
+            'dest_ip': np.zeros(self.n_slots, dtype=np.uint32),
+            'dest_port': np.zeros(self.n_slots, dtype=np.int64),
+        }
+
+        dest_ip_ints = _ips_to_ints(dest_ips)
         for p in range(n_packets):
-            b = packet_starts[p]
-            headers[b]['first'] = (enable[p] and dest_ips[p] != '0.0.0.0')
-            for j in packet_payloads[p]:
-                headers[j]['valid'] = (enable[p] and dest_ips[p] != '0.0.0.0')
-                headers[j]['n_chans'] = nchans_per_packet[p]
-                headers[j]['chan'] = channel_indices[p]
-                headers[j]['feng_id'] = antenna_ids[p]
-                headers[j]['dest_ip'] = dest_ips[p]
-                headers[j]['dest_port'] = dest_ports[p]
-            headers[packet_payloads[p][-1]]['last'] = (enable[p] and dest_ips[p] != '0.0.0.0')
-
-        self._populate_headers(headers)
+            valid = bool(enable[p] and dest_ips[p] != '0.0.0.0')
+            headers['first'][packet_starts[p]] = valid
+            headers['last'][packet_payloads[p][-1]] = valid
+            if not valid:
+                # The template already marks these words invalid, and their
+                # other fields are ignored, so leave them blank
+                continue
+            payload = packet_payloads[p]
+            if isinstance(payload, range):
+                payload = np.arange(payload.start, payload.stop, payload.step)
+            headers['valid'][payload] = valid
+            headers['n_chans'][payload] = nchans_per_packet[p]
+            headers['chan'][payload] = channel_indices[p]
+            headers['feng_id'][payload] = antenna_ids[p]
+            headers['dest_ip'][payload] = dest_ip_ints[p]
+            headers['dest_port'][payload] = dest_ports[p]
+
+        self._populate_headers_arrays(**headers)
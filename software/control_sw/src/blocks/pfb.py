@@ -1,5 +1,3 @@
-import numpy as np
-
 from .block import Block
 from souk_mkid_readout.error_levels import *
 
@@ -83,7 +81,7 @@ class Pfb(Block):
         if stats['overflow_count'] != 0:
             flags['overflow_count'] = FENG_WARNING
         fftshift = self.get_fftshift()
-        stats['fftshift'] = '0b%s' % np.binary_repr(fftshift, width=16)
+        stats['fftshift'] = f'0b{fftshift:016b}'
         return stats, flags
 
     def initialize(self, read_only=False):
@@ -48,7 +48,9 @@ class PfbTvg(Block):
         self._n_samples_per_word = n_samples_per_word
         self.n_chans = n_chans
         self._format = sample_format
-        self._input_size = struct.calcsize(self._format)*self.n_chans*2
+        # Compile the sample format once, rather than on every use
+        self._sample_struct = struct.Struct('>%s' % self._format)
+        self._input_size = self._sample_struct.size*self.n_chans*2
 
     def tvg_enable(self):
         """
@@ -72,6 +74,34 @@ class PfbTvg(Block):
         """
         return bool(self.read_int('ctrl'))
     
+    def _format_input_tvg(self, test_vector):
+        """
+        Format a test vector as the contents of each of an input's RAMs.
+
+        :param test_vector: `self.n_chans`-element test vector. Values should
+            be representable in 16-bit integer format, and may be complex.
+        :type test_vector: list or numpy.ndarray
+
+        :return: Array of shape [n_rams, n_words, n_samples_per_word, 2],
+            where the last axis holds real and imaginary parts. Entry `r`
+            holds the contents of RAM `r`.
+        :rtype: numpy.ndarray
+        """
+        test_vector = np.asarray(test_vector)
+        tvr = test_vector.real.astype('>%s'%self._format)
+        tvi = test_vector.imag.astype('>%s'%self._format)
+        assert (tvr.shape[0] == self.n_chans), "Test vector should have self.n_chans elements!"
+        # build contents of multiple rams. Channel
+        # `n_samples_per_word * n_rams * w + n_samples_per_word * r + s`
+        # is sample `s` of word `w` in ram `r`, so viewing the test vector
+        # as [words x rams x samples] puts each ram's contents in order.
+        n_words = self.n_chans // self._n_rams // self._n_samples_per_word
+        shape = [n_words, self._n_rams, self._n_samples_per_word]
+        d = np.empty([self._n_rams, n_words, self._n_samples_per_word, 2], dtype='>%s'%self._format)
+        d[..., 0] = tvr.reshape(shape).transpose(1, 0, 2)
+        d[..., 1] = tvi.reshape(shape).transpose(1, 0, 2)
+        return d
+
     def write_input_tvg(self, input, test_vector):
         """
         Write a test vector pattern to a single signal input.
@@ -86,23 +116,13 @@ class PfbTvg(Block):
         """
         if self._n_rams == 0:
             raise NotImplementedError('Test vector brams not available in this firmware!')
-        tvr = np.array([x.real for x in test_vector], dtype='>%s'%self._format)
-        tvi = np.array([x.imag for x in test_vector], dtype='>%s'%self._format)
-        assert (tvr.shape[0] == self.n_chans), "Test vector should have self.n_chans elements!"
+        d = self._format_input_tvg(test_vector)
         core_name = '%d' % (input // self._n_serial_inputs)
         sub_index = input % self._n_serial_inputs
         offset = sub_index * self._input_size // self._n_rams
-        # build contents of multiple rams
         for r in range(self._n_rams):
             ram = core_name + '_%d' % r
-            b = b''
-            for w in range(self.n_chans // self._n_rams // self._n_samples_per_word):
-                for s in range(self._n_samples_per_word):
-                    i = self._n_samples_per_word * self._n_rams * w + \
-                        self._n_samples_per_word * r + s
-                    b += struct.pack('>%s' % self._format, tvr[i]) 
-                    b += struct.pack('>%s' % self._format, tvi[i]) 
-            self.write(ram, b, offset=offset)
+            self.write(ram, d[r].tobytes(), offset=offset)
 
     def write_const_per_input(self):
         """
@@ -123,8 +143,17 @@ class PfbTvg(Block):
             return
         ramp = np.arange(self.n_chans)
         ramp = np.array(ramp, dtype='>%s' %self._format)
-        for input in range(self.n_inputs):
-            self.write_input_tvg(input, ramp)
+        # Every input gets the same ramp, and inputs sharing a core are stored
+        # one after another in its rams. So format the ramp once, and fill
+        # each ram for all of its inputs in a single write.
+        d = self._format_input_tvg(ramp)
+        writes = []
+        for core in range(0, self.n_inputs, self._n_serial_inputs):
+            n_sub = min(self._n_serial_inputs, self.n_inputs - core)
+            for r in range(self._n_rams):
+                ram = '%d_%d' % (core // self._n_serial_inputs, r)
+                writes += [(ram, d[r].tobytes() * n_sub)]
+        self.write_many(writes)
 
     def read_input_tvg(self, input):
         """
@@ -145,21 +174,16 @@ class PfbTvg(Block):
         sub_index = input % self._n_serial_inputs
         offset = sub_index * self._input_size // self._n_rams
         out = np.zeros(self.n_chans, dtype=complex)
-        for r in range(self._n_rams):
-            ram = core_name + '_%d' % r
-            n_samples = self.n_chans // self._n_rams
-            n_bytes = n_samples * 2*struct.calcsize(self._format) # to for real+imag
-            s = self.read(ram, n_bytes, offset=offset)
-            d = struct.unpack('>%d%s' % (2*n_samples, self._format), s)
-            dr = d[0::2]
-            di = d[1::2]
-            j = 0
-            for w in range(self.n_chans // self._n_rams // self._n_samples_per_word):
-                for s in range(self._n_samples_per_word):
-                    i = self._n_samples_per_word * self._n_rams * w + \
-                        self._n_samples_per_word * r + s
-                    out[i] = dr[j] + 1j*di[j]
-                    j += 1
+        # View the output as [words x rams x samples], as in `write_input_tvg`
+        n_words = self.n_chans // self._n_rams // self._n_samples_per_word
+        out_rams = out.reshape(n_words, self._n_rams, self._n_samples_per_word)
+        n_samples = self.n_chans // self._n_rams
+        n_bytes = n_samples * 2*self._sample_struct.size # for real+imag
+        raw = self.read_many([(core_name + '_%d' % r, n_bytes, offset) for r in range(self._n_rams)])
+        for r, s in enumerate(raw):
+            d = np.frombuffer(s, dtype='>%s'%self._format).reshape(n_words, self._n_samples_per_word, 2)
+            out_rams[:, r, :].real = d[..., 0]
+            out_rams[:, r, :].imag = d[..., 1]
         return out
 
     def get_status(self):
@@ -3,6 +3,17 @@ import sys
 import logging
 import numpy as np
 
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    # numba is optional. Without it, decorated kernels run as plain python
+    # and callers should prefer their vectorized numpy paths.
+    HAS_NUMBA = False
+    def njit(*args, **kwargs):
+        return lambda f: f
+    prange = range
+
 logger = logging.getLogger(__name__)
 NOTIFY = logging.INFO + 1
 logging.addLevelName(NOTIFY, "NOTIFY")
@@ -63,8 +74,10 @@ def cplx2uint(d, nbits):
     to a UFix<nbits>_<nbits-1> CASPER-standard
     complex number.
     """
-    real = int(np.round(d.real * 2**(nbits-1)))
-    imag = int(np.round(d.imag * 2**(nbits-1)))
+    # Python's round() rounds half to even, like np.round, but avoids
+    # the overhead of a numpy call on a single value
+    real = int(round(d.real * 2**(nbits-1)))
+    imag = int(round(d.imag * 2**(nbits-1)))
     # Saturate
     if real > 2**(nbits-1) - 1:
         real = 2**(nbits-1) -1
@@ -77,6 +90,21 @@ def cplx2uint(d, nbits):
         imag += 2**nbits
     return (real << nbits) + imag
 
+def cplx2uint_array(d, nbits):
+    """
+    Convert an array of floating point complex numbers
+    to UFix<nbits>_<nbits-1> CASPER-standard complex
+    numbers. This is the vectorized equivalent of `cplx2uint`.
+    """
+    mask = 2**nbits - 1
+    real = np.round(np.real(d) * 2**(nbits-1)).astype(np.int64)
+    imag = np.round(np.imag(d) * 2**(nbits-1)).astype(np.int64)
+    # Saturate
+    np.minimum(real, 2**(nbits-1) - 1, out=real)
+    np.minimum(imag, 2**(nbits-1) - 1, out=imag)
+    # interpret as uint
+    return ((real & mask) << nbits) | (imag & mask)
+
 def uint2cplx(d, nbits):
     """
     Convert a CASPER-standard UFix<nbits>_<nbits-1>
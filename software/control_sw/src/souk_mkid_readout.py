@@ -424,6 +424,8 @@ class SoukMkidReadout():
         """
         Call the ```initialize`` methods of all underlying blocks, then
         optionally issue a software global reset.
+        Any register values cached by blocks are discarded first, since
+        the board may have been reprogrammed or reconfigured by another client.
 
         :param read_only: If True, call the underlying initialization methods
             in a read_only manner, and skip software reset.
@@ -438,6 +440,7 @@ class SoukMkidReadout():
                 self.logger.info("Initializing block (read only): %s" % blockname)
             else:
                 self.logger.info("Initializing block (writable): %s" % blockname)
+            block.invalidate_cache()
             block.initialize(read_only=read_only)
         if not read_only:
             self.use_single_dac()